@@ -0,0 +1,163 @@
+"""
+Async read-only endpoints for course content, served under ASGI by the separate uvicorn process
+(`asgi` in Procfile and docker-compose). The web process stays on WSGI, where persistent database
+connections are reused between requests.
+
+Django 4.0 has no async ORM yet, so queries and serialization run in a worker thread with
+sync_to_async, while role checks against the cache and waiting on slow clients stay on the
+event loop. Responses have the same shape as the DRF views.
+"""
+import inspect
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.urls import path
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+
+from users.authentication import CachedJWTAuthentication
+
+from .membership import STUDENT, aload_course_roles
+from .models import Comment, Course, Hometask, Homework, Lecture
+from .pagination import OptionalCursorPagination
+from .resolvers import resolve_route_chain
+from .serializers import (CommentSerializer, CourseSerializer,
+                          HometaskSerializer, HomeworkSerializer,
+                          LectureSerializer)
+
+
+def error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+async def authenticate(request):
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return None, error(str(e.detail), 401)
+    if result is None:
+        return None, error('Authentication credentials were not provided.', 401)
+    return result[0], None
+
+
+def serialize(view, request, queryset, pk):
+    drf_request = Request(request)
+    context = {'request': drf_request}
+    if pk is not None:
+        instance = queryset.filter(pk=pk).first()
+        if instance is None:
+            raise Http404
+        return view.serializer_class(instance, context=context).data
+    paginator = view.pagination_class()
+    page = paginator.paginate_queryset(queryset, drf_request)
+    return paginator.get_paginated_response(view.serializer_class(page, many=True, context=context).data).data
+
+
+class AsyncReadView(ABC):
+    """
+    Async list (without pk) and retrieve (with pk) for members of the course.
+    Subclasses implement get_queryset, the base class cannot be routed.
+    """
+    serializer_class = None
+    pagination_class = OptionalCursorPagination
+
+    @classmethod
+    def as_view(cls):
+        if inspect.isabstract(cls):
+            raise ImproperlyConfigured(f'{cls.__name__} does not implement get_queryset().')
+
+        # Django 4.0 class-based views are sync only, so the view is a plain coroutine function
+        async def view(request, **kwargs):
+            if request.method != 'GET':
+                return error(f'Method "{request.method}" not allowed.', 405)
+            return await cls().get(request, **kwargs)
+        return view
+
+    @abstractmethod
+    def get_queryset(self, user, role, kwargs):
+        """
+        Return queryset of the objects readable by the user with the role in the course.
+        """
+
+    async def get(self, request, pk=None, **kwargs):
+        user, response = await authenticate(request)
+        if response:
+            return response
+
+        course_id = kwargs.get('course_pk', pk)
+        role = None
+        if course_id is not None:
+            role = (await aload_course_roles(user.id)).get(course_id)
+            if role is None:
+                return error('You do not have permission to perform this action.', 403)
+
+        try:
+            if 'lecture_pk' in kwargs:
+                await sync_to_async(resolve_route_chain)(kwargs)
+            queryset = self.get_queryset(user, role, kwargs)
+            data = await sync_to_async(serialize)(self, request, queryset, pk)
+        except Http404:
+            return error('Not found.', 404)
+        return JsonResponse(data, safe=False)
+
+
+class CourseReadView(AsyncReadView):
+    serializer_class = CourseSerializer
+    pagination_class = LimitOffsetPagination
+
+    def get_queryset(self, user, role, kwargs):
+        return Course.objects.filter(memberships__user=user)
+
+
+class LectureReadView(AsyncReadView):
+    serializer_class = LectureSerializer
+
+    def get_queryset(self, user, role, kwargs):
+        return Lecture.objects.filter(course=kwargs['course_pk']).select_related('course')
+
+
+class HometaskReadView(AsyncReadView):
+    serializer_class = HometaskSerializer
+
+    def get_queryset(self, user, role, kwargs):
+        return Hometask.objects.filter(lecture=kwargs['lecture_pk']).select_related('lecture')
+
+
+class HomeworkReadView(AsyncReadView):
+    serializer_class = HomeworkSerializer
+
+    def get_queryset(self, user, role, kwargs):
+        queryset = Homework.objects.filter(hometask=kwargs['hometask_pk']).select_related('hometask', 'student')
+        if role == STUDENT:
+            return queryset.filter(student=user)
+        return queryset.order_by(F('created').desc(nulls_first=True))
+
+
+class CommentReadView(AsyncReadView):
+    serializer_class = CommentSerializer
+
+    def get_queryset(self, user, role, kwargs):
+        return Comment.objects.filter(homework=kwargs['homework_pk']).select_related('homework', 'owner')
+
+
+lecture_path = '<int:course_pk>/lecture/'
+hometask_path = lecture_path + '<int:lecture_pk>/hometask/'
+homework_path = hometask_path + '<int:hometask_pk>/homework/'
+comment_path = homework_path + '<int:homework_pk>/comment/'
+
+urlpatterns = [
+    path('', CourseReadView.as_view(), name='async-course-list'),
+    path('<int:pk>/', CourseReadView.as_view(), name='async-course-detail'),
+    path(lecture_path, LectureReadView.as_view(), name='async-lecture-list'),
+    path(lecture_path + '<int:pk>/', LectureReadView.as_view(), name='async-lecture-detail'),
+    path(hometask_path, HometaskReadView.as_view(), name='async-hometask-list'),
+    path(hometask_path + '<int:pk>/', HometaskReadView.as_view(), name='async-hometask-detail'),
+    path(homework_path, HomeworkReadView.as_view(), name='async-homework-list'),
+    path(homework_path + '<int:pk>/', HomeworkReadView.as_view(), name='async-homework-detail'),
+    path(comment_path, CommentReadView.as_view(), name='async-comment-list'),
+    path(comment_path + '<int:pk>/', CommentReadView.as_view(), name='async-comment-detail'),
+]
@@ -0,0 +1,41 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Course, CourseMembership, Hometask, Homework, Lecture
+
+
+def count_of(model, parent, **filters):
+    """
+    Correlated subquery counting rows of model which belong to the outer row.
+    """
+    rows = model.objects.filter(**{parent: OuterRef('pk')}, **filters).order_by().values(parent)
+    return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+
+def increment(model, pk, **deltas):
+    """
+    Atomically add deltas to counter columns of one row.
+    """
+    deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if deltas:
+        model.objects.filter(pk=pk).update(**deltas)
+
+
+def recount_roster(course_ids=None):
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+    courses.update(
+        teacher_count=count_of(CourseMembership, 'course', role=CourseMembership.TEACHER),
+        student_count=count_of(CourseMembership, 'course', role=CourseMembership.STUDENT),
+    )
+
+
+def rebuild_counters():
+    recount_roster()
+    Course.objects.update(lecture_count=count_of(Lecture, 'course'))
+    Lecture.objects.update(hometask_count=count_of(Hometask, 'lecture'))
+    Hometask.objects.update(
+        homework_count=count_of(Homework, 'hometask'),
+        graded_count=count_of(Homework, 'hometask', mark__isnull=False),
+    )
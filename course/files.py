@@ -0,0 +1,123 @@
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework.renderers import BaseRenderer
+
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    Lets file download actions answer any Accept header with a plain Django response.
+    Only error details are rendered, as json.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data) if data is not None else b''
+
+
+def file_etag(name, size, modified):
+    return quote_etag(hashlib.md5(f'{name}:{size}:{modified.timestamp()}'.encode()).hexdigest())
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) of a single `bytes=` range, None if it is absent or unsupported,
+    raise ValueError if it is not satisfiable.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError
+    return start, end
+
+
+def iter_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_file(request, field_file):
+    """
+    Return download response for FieldFile: 304 for matching ETag, X-Accel-Redirect/X-Sendfile
+    when the front proxy is configured to send files, otherwise streamed file with Range support.
+    """
+    if not field_file:
+        raise Http404
+    storage = field_file.storage
+    name = field_file.name
+    try:
+        size = storage.size(name)
+        modified = storage.get_modified_time(name)
+    except (OSError, NotImplementedError):
+        raise Http404
+
+    etag = file_etag(name, size, modified)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(modified.timestamp()),
+        'Accept-Ranges': 'bytes',
+    }
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return HttpResponseNotModified(headers=headers)
+
+    # blobs are named by content, downloads get the name they were uploaded with
+    filename = getattr(field_file.instance, 'filename', '') or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    headers['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+
+    if settings.FILE_ACCEL_REDIRECT_PREFIX:
+        # nginx serves the bytes and handles Range itself
+        headers['X-Accel-Redirect'] = settings.FILE_ACCEL_REDIRECT_PREFIX + quote(name)
+        return HttpResponse(content_type=content_type, headers=headers)
+    if settings.FILE_SENDFILE:
+        headers['X-Sendfile'] = storage.path(name)
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    # Range is ignored if client's copy (If-Range) is outdated
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+    if byte_range is None:
+        response = FileResponse(storage.open(name, 'rb'), content_type=content_type)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(iter_range(storage.open(name, 'rb'), start, length),
+                                     status=206, content_type=content_type, headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    return response
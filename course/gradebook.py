@@ -0,0 +1,129 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from courses_site.db_router import primary_reads
+
+from .models import CourseMembership, Gradebook, Hometask, Homework
+
+CACHE_KEY = 'gradebook:{}'
+CACHE_TIMEOUT = 60 * 60
+
+
+def build_gradebook(course_id):
+    """
+    Compute gradebook data with one aggregated query over hometasks and their homework.
+    Cell is the best mark of student's homework for the hometask, null if it is not marked yet.
+    Enrolled students without homework get an empty row.
+    """
+    data = {'hometasks': {}, 'marks': {}}
+    for student_id in CourseMembership.objects.filter(course=course_id, role=CourseMembership.STUDENT)\
+            .values_list('user_id', flat=True):
+        data['marks'][str(student_id)] = {}
+    rows = Hometask.objects.filter(lecture__course=course_id)\
+        .values('id', 'lecture_id', 'max_mark', 'homework__student_id')\
+        .annotate(mark=Max('homework__mark')).order_by()
+    for row in rows:
+        data['hometasks'][str(row['id'])] = {'lecture': row['lecture_id'], 'max_mark': row['max_mark']}
+        if row['homework__student_id'] is not None:
+            data['marks'].setdefault(str(row['homework__student_id']), {})[str(row['id'])] = row['mark']
+    return data
+
+
+def get_gradebook(course_id):
+    key = CACHE_KEY.format(course_id)
+    data = cache.get(key)
+    if data is None:
+        with primary_reads():
+            data = Gradebook.objects.filter(course_id=course_id).values_list('data', flat=True).first()
+            if not data:
+                data = store_gradebook(course_id)
+        # a writer committing meanwhile caches its fresher snapshot, which this one must not replace
+        cache.add(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def store_gradebook(course_id):
+    """
+    Build and store the snapshot under the gradebook row lock. Writers of cells hold the same lock
+    until they commit, so the build either sees their marks or runs before they apply them to it.
+    """
+    Gradebook.objects.get_or_create(course_id=course_id)
+    with transaction.atomic():
+        gradebook = Gradebook.objects.select_for_update().filter(course_id=course_id).first()
+        if gradebook is None:
+            # dropped meanwhile by a hometask change, stored again by the next read
+            return build_gradebook(course_id)
+        if not gradebook.data:
+            gradebook.data = build_gradebook(course_id)
+            gradebook.save(update_fields=['data', 'created'])
+        return gradebook.data
+
+
+def change_gradebook(course_id, change):
+    """
+    Apply change(data) to the stored snapshot under its row lock, held until the caller commits.
+    Without a built snapshot an empty one is locked instead, so a concurrent build waits for the caller.
+    """
+    with transaction.atomic():
+        gradebook = Gradebook.objects.select_for_update().filter(course_id=course_id).first()
+        if gradebook is None:
+            gradebook, created = Gradebook.objects.get_or_create(course_id=course_id)
+            if not created:
+                gradebook = Gradebook.objects.select_for_update().get(course_id=course_id)
+        if not gradebook.data:
+            return
+        data = gradebook.data
+        change(data)
+        gradebook.save(update_fields=['data', 'created'])
+    cache.delete(CACHE_KEY.format(course_id))
+    transaction.on_commit(lambda: cache.set(CACHE_KEY.format(course_id), data, CACHE_TIMEOUT))
+
+
+def update_gradebook_cells(course_id, cells):
+    """
+    Recompute (student_id, hometask_id) cells of stored gradebook, if there is one.
+    """
+    cells = set(cells)
+    if not cells:
+        return
+
+    def change(data):
+        student_ids = {student_id for student_id, _ in cells}
+        hometask_ids = {hometask_id for _, hometask_id in cells}
+        marks = Homework.objects.filter(student_id__in=student_ids, hometask_id__in=hometask_ids)\
+            .values('student_id', 'hometask_id').annotate(mark=Max('mark')).order_by()
+        found = {(row['student_id'], row['hometask_id']): row['mark'] for row in marks}
+        for student_id, hometask_id in cells:
+            student_marks = data['marks'].setdefault(str(student_id), {})
+            if (student_id, hometask_id) in found:
+                student_marks[str(hometask_id)] = found[student_id, hometask_id]
+            else:
+                student_marks.pop(str(hometask_id), None)
+
+    change_gradebook(course_id, change)
+
+
+def sync_gradebook_students(course_id):
+    """
+    Add empty rows of newly enrolled students and drop empty rows of students who left the course.
+    """
+    def change(data):
+        student_ids = {str(student_id) for student_id in CourseMembership.objects.filter(
+            course=course_id, role=CourseMembership.STUDENT).values_list('user_id', flat=True)}
+        for student_id in student_ids - data['marks'].keys():
+            data['marks'][student_id] = {}
+        for student_id in data['marks'].keys() - student_ids:
+            if not data['marks'][student_id]:
+                del data['marks'][student_id]
+
+    change_gradebook(course_id, change)
+
+
+def drop_gradebook(course_id):
+    """
+    Forget stored gradebook when hometasks change, it is rebuilt on the next read.
+    """
+    Gradebook.objects.filter(course_id=course_id).delete()
+    cache.delete(CACHE_KEY.format(course_id))
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY.format(course_id)))
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+async def fetch(host, port, request, slow_delay):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        if slow_delay:
+            # slow client: the request line arrives first, headers after a pause
+            head, rest = request.split(b'\r\n', 1)
+            writer.write(head + b'\r\n')
+            await writer.drain()
+            await asyncio.sleep(slow_delay)
+            writer.write(rest)
+        else:
+            writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def worker(host, port, request, deadline, slow_delay, latencies, errors):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            status = await fetch(host, port, request, slow_delay)
+        except (OSError, IndexError, ValueError):
+            status = None
+        if status == 200:
+            latencies.append(time.monotonic() - started)
+        else:
+            errors.append(status)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Command(BaseCommand):
+    help = ('Load a running server (WSGI or ASGI) with concurrent, optionally slow, clients '
+            'and report requests/sec and latency percentiles as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://127.0.0.1:8000/async/course/1/lecture/')
+        parser.add_argument('--token', help='JWT access token sent as Bearer authorization.')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds.')
+        parser.add_argument('--slow-clients', type=float, default=0.0,
+                            help='Share of clients that pause between request line and headers.')
+        parser.add_argument('--slow-delay', type=float, default=0.5, help='Pause of slow clients, seconds.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        path = url.path + (f'?{url.query}' if url.query else '')
+        headers = [f'GET {path or "/"} HTTP/1.1', f'Host: {url.netloc}', 'Connection: close']
+        if options['token']:
+            headers.append(f'Authorization: Bearer {options["token"]}')
+        request = ('\r\n'.join(headers) + '\r\n\r\n').encode()
+
+        latencies, errors = [], []
+        slow = int(options['concurrency'] * options['slow_clients'])
+
+        async def run():
+            deadline = time.monotonic() + options['duration']
+            await asyncio.gather(*(
+                worker(url.hostname, url.port or 80, request, deadline,
+                       options['slow_delay'] if i < slow else 0, latencies, errors)
+                for i in range(options['concurrency'])
+            ))
+
+        started = time.monotonic()
+        asyncio.run(run())
+        elapsed = time.monotonic() - started
+        self.stdout.write(json.dumps({
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'slow_clients': slow,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        }))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from course.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized course, lecture and hometask counters, e.g. after bulk loads.'
+
+    def handle(self, *args, **options):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Counters rebuilt.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from course.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate search entries of courses, lectures and hometasks, e.g. after bulk loads.'
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {count} entries.'))
@@ -0,0 +1,23 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+
+from course.seeding import SEED_PASSWORD, SeedScale, seed
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic courses, users, lectures, hometasks, homework and comments for load tests.'
+
+    def add_arguments(self, parser):
+        defaults = SeedScale()
+        for name, value in defaults.__dict__.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value)
+        parser.add_argument('--factor', type=int, default=1, help='Multiply courses and users.')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        scale = SeedScale(**{name: options[name] for name in SeedScale().__dict__}).scaled(options['factor'])
+        created = seed(scale, random.Random(options['seed']))
+        self.stdout.write(json.dumps(created))
+        self.stdout.write(self.style.SUCCESS(f'Seeded, every generated user has password "{SEED_PASSWORD}".'))
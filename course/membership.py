@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import CourseMembership
+
+TEACHER = CourseMembership.TEACHER
+STUDENT = CourseMembership.STUDENT
+
+CACHE_KEY = 'course-roles:{}'
+CACHE_TIMEOUT = 60 * 60
+
+
+def load_course_roles(user_id):
+    """
+    Return {course_id: role} map of the user, shared between requests through the cache.
+    """
+    key = CACHE_KEY.format(user_id)
+    roles = cache.get(key)
+    if roles is None:
+        # read from the primary, a lagging replica would be cached for the whole timeout
+        roles = dict(CourseMembership.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id)
+                     .values_list('course_id', 'role'))
+        cache.set(key, roles, CACHE_TIMEOUT)
+    return roles
+
+
+async def aload_course_roles(user_id):
+    """
+    Async variant of load_course_roles, the database is only hit on cache miss.
+    """
+    roles = await cache.aget(CACHE_KEY.format(user_id))
+    if roles is None:
+        roles = await sync_to_async(load_course_roles)(user_id)
+    return roles
+
+
+def get_course_roles(request):
+    """
+    Return {course_id: role} map of the request user, loaded once per request.
+    """
+    roles = getattr(request, '_course_roles', None)
+    if roles is None:
+        user = request.user
+        roles = load_course_roles(user.id) if user.is_authenticated else {}
+        request._course_roles = roles
+    return roles
+
+
+def get_course_role(request, course_id):
+    """
+    Return role of the request user in the course or None.
+    """
+    try:
+        course_id = int(course_id)
+    except (TypeError, ValueError):
+        return None
+    return get_course_roles(request).get(course_id)
+
+
+def has_role_conflict(course, users, role):
+    """
+    Check if any of the users already has another role in the course.
+    """
+    return CourseMembership.objects.filter(course=course, user__in=users).exclude(role=role).exists()
+
+
+def invalidate_course_roles(user_ids):
+    """
+    Evict cached roles now and again after commit, a request running before the commit
+    would otherwise cache the old roster for the whole timeout.
+    """
+    keys = [CACHE_KEY.format(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
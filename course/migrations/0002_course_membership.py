@@ -0,0 +1,84 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_rosters(apps, schema_editor):
+    Course = apps.get_model('course', 'Course')
+    CourseMembership = apps.get_model('course', 'CourseMembership')
+    # teachers go first, so a user present in both rosters stays a teacher
+    for role, through in (('teacher', Course.teachers.through), ('student', Course.students.through)):
+        rows = through.objects.values_list('course_id', 'user_id').iterator()
+        CourseMembership.objects.bulk_create(
+            (CourseMembership(course_id=course_id, user_id=user_id, role=role) for course_id, user_id in rows),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+def copy_memberships_back(apps, schema_editor):
+    Course = apps.get_model('course', 'Course')
+    CourseMembership = apps.get_model('course', 'CourseMembership')
+    for role, through in (('teacher', Course.teachers.through), ('student', Course.students.through)):
+        rows = CourseMembership.objects.filter(role=role).values_list('course_id', 'user_id').iterator()
+        through.objects.bulk_create(
+            (through(course_id=course_id, user_id=user_id) for course_id, user_id in rows),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('course', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('teacher', 'Teacher'), ('student', 'Student')], max_length=7)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='courses', through='course.CourseMembership', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='coursemembership',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='course.course'),
+        ),
+        migrations.AddField(
+            model_name='coursemembership',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_memberships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='coursemembership',
+            index=models.Index(fields=['user', 'course', 'role'], name='membership_user_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursemembership',
+            index=models.Index(fields=['course', 'role', 'user'], name='membership_roster_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursemembership',
+            constraint=models.UniqueConstraint(fields=('course', 'user'), name='unique_course_membership'),
+        ),
+        migrations.RunPython(copy_rosters, copy_memberships_back),
+        migrations.RemoveField(
+            model_name='course',
+            name='students',
+        ),
+        migrations.RemoveField(
+            model_name='course',
+            name='teachers',
+        ),
+    ]
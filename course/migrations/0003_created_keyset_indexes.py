@@ -0,0 +1,29 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0002_course_membership'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['homework', 'created', 'id'], name='comment_homework_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hometask',
+            index=models.Index(fields=['lecture', 'created', 'id'], name='hometask_lecture_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homework',
+            index=models.Index(fields=['hometask', 'created', 'id'], name='homework_hometask_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lecture',
+            index=models.Index(fields=['course', 'created', 'id'], name='lecture_course_created_idx'),
+        ),
+    ]
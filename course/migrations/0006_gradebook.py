@@ -0,0 +1,22 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0005_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Gradebook',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='course.course')),
+                ('data', models.JSONField(default=dict)),
+                ('created', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
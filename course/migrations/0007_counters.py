@@ -0,0 +1,69 @@
+# Generated by Django 4.0.1 on 2026-10-18 06:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Course = apps.get_model('course', 'Course')
+    CourseMembership = apps.get_model('course', 'CourseMembership')
+    Lecture = apps.get_model('course', 'Lecture')
+    Hometask = apps.get_model('course', 'Hometask')
+    Homework = apps.get_model('course', 'Homework')
+
+    def count_of(model, parent, **filters):
+        rows = model.objects.filter(**{parent: OuterRef('pk')}, **filters).order_by().values(parent)
+        return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+    Course.objects.update(
+        lecture_count=count_of(Lecture, 'course'),
+        teacher_count=count_of(CourseMembership, 'course', role='teacher'),
+        student_count=count_of(CourseMembership, 'course', role='student'),
+    )
+    Lecture.objects.update(hometask_count=count_of(Hometask, 'lecture'))
+    Hometask.objects.update(
+        homework_count=count_of(Homework, 'hometask'),
+        graded_count=count_of(Homework, 'hometask', mark__isnull=False),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0006_gradebook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lecture_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='student_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='teacher_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hometask',
+            name='graded_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='hometask',
+            name='homework_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lecture',
+            name='hometask_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 4.0.1 on 2026-10-18 07:17
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRES_SQL = [
+    """
+    CREATE FUNCTION course_searchentry_document() RETURNS trigger AS $$
+    BEGIN
+        NEW.document := setweight(to_tsvector('english', NEW.title), 'A')
+            || setweight(to_tsvector('english', NEW.body), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER course_searchentry_document BEFORE INSERT OR UPDATE ON course_searchentry
+    FOR EACH ROW EXECUTE PROCEDURE course_searchentry_document()
+    """,
+    "CREATE INDEX course_searchentry_document_idx ON course_searchentry USING gin (document)",
+]
+POSTGRES_REVERSE_SQL = [
+    "DROP TRIGGER course_searchentry_document ON course_searchentry",
+    "DROP FUNCTION course_searchentry_document()",
+]
+SQLITE_SQL = [
+    """
+    CREATE VIRTUAL TABLE course_searchentry_fts USING fts5(
+        title, body, content='course_searchentry', content_rowid='id', tokenize='porter unicode61')
+    """,
+    """
+    CREATE TRIGGER course_searchentry_fts_insert AFTER INSERT ON course_searchentry BEGIN
+        INSERT INTO course_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER course_searchentry_fts_delete AFTER DELETE ON course_searchentry BEGIN
+        INSERT INTO course_searchentry_fts(course_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER course_searchentry_fts_update AFTER UPDATE ON course_searchentry BEGIN
+        INSERT INTO course_searchentry_fts(course_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO course_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+SQLITE_REVERSE_SQL = [
+    "DROP TRIGGER course_searchentry_fts_insert",
+    "DROP TRIGGER course_searchentry_fts_delete",
+    "DROP TRIGGER course_searchentry_fts_update",
+    "DROP TABLE course_searchentry_fts",
+]
+FILL_SQL = [
+    """
+    INSERT INTO course_searchentry (kind, object_id, course_id, lecture_id, title, body)
+    SELECT 'course', id, id, NULL, name, COALESCE(description, '') FROM course_course
+    """,
+    """
+    INSERT INTO course_searchentry (kind, object_id, course_id, lecture_id, title, body)
+    SELECT 'lecture', id, course_id, id, name, '' FROM course_lecture
+    """,
+    """
+    INSERT INTO course_searchentry (kind, object_id, course_id, lecture_id, title, body)
+    SELECT 'hometask', hometask.id, lecture.course_id, lecture.id, '', hometask.text
+    FROM course_hometask hometask JOIN course_lecture lecture ON lecture.id = hometask.lecture_id
+    """,
+]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_search_entries(apps, schema_editor):
+    for statement in FILL_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0008_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Course'), ('lecture', 'Lecture'), ('hometask', 'Hometask')], max_length=8)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('document', django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.course')),
+                ('lecture', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='course.lecture')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry'),
+        ),
+        # full-text index of the backend, other backends get the table without it
+        migrations.RunPython(run_vendor_sql({'postgresql': POSTGRES_SQL, 'sqlite': SQLITE_SQL}),
+                             run_vendor_sql({'postgresql': POSTGRES_REVERSE_SQL, 'sqlite': SQLITE_REVERSE_SQL})),
+        migrations.RunPython(fill_search_entries, migrations.RunPython.noop),
+    ]
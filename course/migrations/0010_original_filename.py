@@ -0,0 +1,34 @@
+# Generated by Django 4.0.1 on 2026-10-18 08:26
+
+import course.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0009_search_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homework',
+            name='filename',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='lecture',
+            name='filename',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='homework',
+            name='file',
+            field=course.storage.ContentFileField(storage=course.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='lecture',
+            name='file',
+            field=course.storage.ContentFileField(storage=course.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
@@ -1,24 +1,97 @@
+import uuid
+
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from .storage import ContentFileField, content_storage
+
 
 class Course(models.Model):
     name = models.CharField(max_length=15)
     slug = models.SlugField(unique=True)
     description = models.TextField(max_length=150, blank=True, null=True)
     created = models.DateTimeField(auto_now=True, editable=False)
-    teachers = models.ManyToManyField(User, blank=True, related_name='as_teacher')
-    students = models.ManyToManyField(User, blank=True, related_name='as_student')
+    members = models.ManyToManyField(User, blank=True, through='CourseMembership', related_name='courses')
+    # denormalized counters, see course.counters
+    lecture_count = models.PositiveIntegerField(default=0, editable=False)
+    teacher_count = models.PositiveIntegerField(default=0, editable=False)
+    student_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f'Course {self.name}'
 
+    def delete(self, *args, **kwargs):
+        # memberships go with the course, their per-row receivers would update counters, roles and
+        # the gradebook of a course being deleted, see course.signals
+        from .roster import bulk_roster_change
+        with bulk_roster_change():
+            return super().delete(*args, **kwargs)
+
+    @property
+    def teachers(self):
+        return User.objects.filter(course_memberships__course=self,
+                                   course_memberships__role=CourseMembership.TEACHER)
+
+    @property
+    def students(self):
+        return User.objects.filter(course_memberships__course=self,
+                                   course_memberships__role=CourseMembership.STUDENT)
+
+
+class CourseMembership(models.Model):
+    TEACHER = 'teacher'
+    STUDENT = 'student'
+    ROLE_CHOICES = (
+        (TEACHER, 'Teacher'),
+        (STUDENT, 'Student'),
+    )
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='course_memberships')
+    role = models.CharField(max_length=7, choices=ROLE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'user'], name='unique_course_membership'),
+        ]
+        indexes = [
+            # user's courses with roles, read without touching the table
+            models.Index(fields=['user', 'course', 'role'], name='membership_user_course_idx'),
+            # course roster by role
+            models.Index(fields=['course', 'role', 'user'], name='membership_roster_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.role.capitalize()} {self.user_id} of course {self.course_id}'
+
+
+class StoredBlob(models.Model):
+    """
+    Reference counter of file stored by content hash, see course.storage.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    def __str__(self):
+        return f'Blob {self.name}'
+
 
 class Lecture(models.Model):
     name = models.CharField(max_length=15)
-    file = models.FileField()
+    file = ContentFileField(storage=content_storage)
+    filename = models.CharField(max_length=255, blank=True, editable=False)
     created = models.DateTimeField(auto_now=True, editable=False)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    hometask_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'created', 'id'], name='lecture_course_created_idx'),
+        ]
 
     def __str__(self):
         return f'Lecture {self.name}'
@@ -29,18 +102,31 @@ class Hometask(models.Model):
     max_mark = models.PositiveIntegerField(default=10)
     lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now=True, editable=False)
+    homework_count = models.PositiveIntegerField(default=0, editable=False)
+    graded_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lecture', 'created', 'id'], name='hometask_lecture_created_idx'),
+        ]
 
     def __str__(self):
         return f'Hometask {self.id}'
 
 
 class Homework(models.Model):
-    file = models.FileField()
+    file = ContentFileField(storage=content_storage)
+    filename = models.CharField(max_length=255, blank=True, editable=False)
     created = models.DateTimeField(auto_now=True, editable=False)
     mark = models.PositiveIntegerField(blank=True, null=True)
     hometask = models.ForeignKey(Hometask, on_delete=models.CASCADE)
     student = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hometask', 'created', 'id'], name='homework_hometask_created_idx'),
+        ]
+
     def __str__(self):
         return f'Homework {self.id}'
 
@@ -51,5 +137,101 @@ class Comment(models.Model):
     homework = models.ForeignKey(Homework, on_delete=models.CASCADE)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['homework', 'created', 'id'], name='comment_homework_created_idx'),
+        ]
+
     def __str__(self):
         return f'Comment {self.id}'
+
+
+class UploadSession(models.Model):
+    """
+    Chunked upload of Lecture/Homework file, attached to the target only on completion.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, blank=True, null=True)
+    homework = models.ForeignKey(Homework, on_delete=models.CASCADE, blank=True, null=True)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    completed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now=True, editable=False)
+
+    def __str__(self):
+        return f'Upload {self.id}'
+
+    @property
+    def target(self):
+        return self.lecture or self.homework
+
+
+class Gradebook(models.Model):
+    """
+    Materialized student x hometask marks of a course, see course.gradebook.
+    """
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True)
+    data = models.JSONField(default=dict)
+    created = models.DateTimeField(auto_now=True, editable=False)
+
+    def __str__(self):
+        return f'Gradebook of course {self.course_id}'
+
+
+class Notification(models.Model):
+    LECTURE = 'lecture'
+    HOMETASK = 'hometask'
+    KIND_CHOICES = (
+        (LECTURE, 'Lecture'),
+        (HOMETASK, 'Hometask'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    text = models.CharField(max_length=255)
+    read = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created', 'id'], name='notification_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Notification {self.id}'
+
+
+class SearchEntry(models.Model):
+    """
+    Searchable text of a course, lecture or hometask, see course.search.
+    """
+    COURSE = 'course'
+    LECTURE = 'lecture'
+    HOMETASK = 'hometask'
+    KIND_CHOICES = (
+        (COURSE, 'Course'),
+        (LECTURE, 'Lecture'),
+        (HOMETASK, 'Hometask'),
+    )
+
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE, blank=True, null=True)
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    # filled by a database trigger on postgres, sqlite keeps the text in a fts5 table instead
+    document = SearchVectorField(blank=True, null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+
+    def __str__(self):
+        return f'Search entry of {self.kind} {self.object_id}'
@@ -0,0 +1,123 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, Cursor,
+                                       CursorPagination, LimitOffsetPagination)
+
+
+class CreatedCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created, id), newest first.
+    The cursor holds values of all ordering fields, so rows with equal `created` are paged by id
+    instead of the offset DRF falls back to for ties of the first field.
+    """
+    ordering = ('-created', '-id')
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    position_separator = ','
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor and self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*[field[1:] if field.startswith('-') else f'-{field}'
+                                           for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.keyset_filter(queryset.model, current_position, reverse))
+
+        # one extra row tells if there are more rows in the direction of the cursor
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+        self.has_next = True if reverse else has_more
+        self.has_previous = has_more if reverse else current_position is not None
+        self.next_position = self.previous_position = current_position
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def keyset_filter(self, model, position, reverse):
+        """
+        Rows after the position in the ordering, e.g. created < c OR (created = c AND id < i) for ('-created', '-id').
+        """
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [instance[field.lstrip('-')] if isinstance(instance, dict) else getattr(instance, field.lstrip('-'))
+                  for field in ordering]
+        return self.position_separator.join(
+            value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values)
+
+
+class OptionalCursorPagination(BasePagination):
+    """
+    Limit/offset pagination by default, keyset pagination with `?pagination=cursor`.
+    Cursor links keep the query string, so next pages stay in cursor mode.
+    """
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+
+    def __init__(self):
+        self.paginator = LimitOffsetPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == self.cursor_mode:
+            self.paginator = CreatedCursorPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return LimitOffsetPagination().get_paginated_response_schema(schema)
+
+    def get_schema_fields(self, view):
+        fields = LimitOffsetPagination().get_schema_fields(view)
+        names = {field.name for field in fields}
+        return fields + [field for field in CreatedCursorPagination().get_schema_fields(view)
+                         if field.name not in names]
+
+    def get_schema_operation_parameters(self, view):
+        parameters = LimitOffsetPagination().get_schema_operation_parameters(view)
+        names = {parameter['name'] for parameter in parameters}
+        return parameters + [parameter for parameter in CreatedCursorPagination().get_schema_operation_parameters(view)
+                             if parameter['name'] not in names]
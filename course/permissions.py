@@ -1,17 +1,21 @@
 from rest_framework.permissions import BasePermission
 
+from .membership import STUDENT, TEACHER, get_course_role
+
+
+def get_view_course_id(view):
+    course_id = view.kwargs.get('course_pk')
+    if not course_id:
+        course_id = view.kwargs['pk']
+    return course_id
+
 
 class TeacherPermissions(BasePermission):
     """
     All permissions to teacher.
     """
     def has_permission(self, request, view):
-        course_id = view.kwargs.get('course_pk')
-        if not course_id:
-            course_id = view.kwargs['pk']
-        if request.user.as_teacher.filter(id=course_id).exists():
-            return True
-        return False
+        return get_course_role(request, get_view_course_id(view)) == TEACHER
 
 
 class StudentPermissions(BasePermission):
@@ -19,12 +23,7 @@ class StudentPermissions(BasePermission):
     All permissions to student.
     """
     def has_permission(self, request, view):
-        course_id = view.kwargs.get('course_pk')
-        if not course_id:
-            course_id = view.kwargs['pk']
-        if request.user.as_student.filter(id=course_id).exists():
-            return True
-        return False
+        return get_course_role(request, get_view_course_id(view)) == STUDENT
 
 
 class IsOwnerOfComment(BasePermission):
@@ -0,0 +1,88 @@
+from collections import namedtuple
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
+
+from .models import Course, Hometask, Homework, Lecture
+
+RouteChain = namedtuple('RouteChain', ('course', 'lecture', 'hometask', 'homework'), defaults=(None,) * 4)
+
+# nested route kwarg, model and its parent field, deepest first
+ROUTE_LEVELS = (
+    ('homework_pk', Homework, 'hometask'),
+    ('hometask_pk', Hometask, 'lecture'),
+    ('lecture_pk', Lecture, 'course'),
+    ('course_pk', Course, None),
+)
+
+
+def resolve_route_chain(kwargs):
+    """
+    Load the ancestors named by nested route kwargs with one joined query.
+    Raises Http404 if any of them is missing or does not belong to its parent.
+    """
+    levels = [level for level in ROUTE_LEVELS if level[0] in kwargs]
+    if not levels:
+        return RouteChain()
+
+    lookups = {'pk': kwargs[levels[0][0]]}
+    path = []
+    for (kwarg, model, parent), (parent_kwarg, _, _) in zip(levels, levels[1:]):
+        path.append(parent)
+        lookups['__'.join(path)] = kwargs[parent_kwarg]
+
+    model = levels[0][1]
+    queryset = model.objects.all()
+    if path:
+        queryset = queryset.select_related('__'.join(path))
+    try:
+        obj = queryset.get(**lookups)
+    except (ObjectDoesNotExist, ValueError):
+        raise Http404
+
+    chain = {}
+    for kwarg, model, parent in levels:
+        chain[model._meta.model_name] = obj
+        obj = getattr(obj, parent) if parent else None
+    return RouteChain(**chain)
+
+
+class NestedRouteMixin:
+    """
+    Resolves ancestor chain of nested route once per request, so mismatched urls are 404
+    and views/serializers get parents without fetching them again.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # membership check already proves the course exists, deeper chains must be validated
+        if 'lecture_pk' in self.kwargs:
+            request.route_chain = resolve_route_chain(self.kwargs)
+
+    @property
+    def route_chain(self):
+        chain = getattr(self.request, 'route_chain', None)
+        if chain is None:
+            chain = self.request.route_chain = resolve_route_chain(self.kwargs)
+        return chain
+
+
+def get_course_id(instance):
+    """
+    Return course id of a lecture, hometask or homework with at most one query per instance.
+    The result is kept on the instance for the other signal receivers of the same save, together with
+    the parent id it was looked up for.
+    """
+    if isinstance(instance, Lecture):
+        return instance.course_id
+    if isinstance(instance, Hometask):
+        if Hometask.lecture.is_cached(instance):
+            return instance.lecture.course_id
+        parent_id = instance.lecture_id
+        queryset = Lecture.objects.filter(pk=parent_id).values_list('course_id', flat=True)
+    else:
+        parent_id = instance.hometask_id
+        queryset = Hometask.objects.filter(pk=parent_id).values_list('lecture__course_id', flat=True)
+    cached = getattr(instance, '_course_id', None)
+    if cached is None or cached[0] != parent_id:
+        cached = instance._course_id = (parent_id, queryset.first())
+    return cached[1]
@@ -0,0 +1,115 @@
+"""
+Response cache for course API reads.
+
+Entries are keyed by endpoint, role (user for user-specific views), URL and the version of
+the course they belong to. Changes in a course subtree replace its version, so all cached
+responses of that course become unreachable at once and expire by timeout.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from courses_site.db_router import primary_reads
+
+from .membership import STUDENT, get_course_role, get_course_roles
+
+VERSION_KEY = 'course-version:{}'
+STATS_KEY = 'response-cache:{}'
+HIT, MISS = 'hit', 'miss'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_course_versions(course_ids):
+    """
+    Return {course_id: version}, creating versions of courses seen for the first time.
+    """
+    cache = get_cache()
+    keys = {VERSION_KEY.format(course_id): course_id for course_id in course_ids}
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump_course_versions(course_ids):
+    """
+    Evict cached responses of the courses, again after commit so readers of the old rows
+    in the meantime cannot leave them cached.
+    """
+    course_ids = [course_id for course_id in course_ids if course_id]
+    if not course_ids:
+        return
+
+    def bump():
+        get_cache().set_many({VERSION_KEY.format(course_id): uuid.uuid4().hex for course_id in course_ids}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def count(outcome):
+    cache = get_cache()
+    key = STATS_KEY.format(outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    values = get_cache().get_many([STATS_KEY.format(HIT), STATS_KEY.format(MISS)])
+    hits, misses = values.get(STATS_KEY.format(HIT), 0), values.get(STATS_KEY.format(MISS), 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
+
+
+class CachedResponseMixin:
+    """
+    Serve list/retrieve from the response cache. Views whose queryset depends on the student
+    set `cache_per_student`, other views share entries between users of the same role.
+    """
+    cache_per_student = False
+
+    def get_response_cache_key(self, request):
+        course_id = self.kwargs.get('course_pk', self.kwargs.get('pk'))
+        if course_id is not None:
+            role = get_course_role(request, course_id)
+            versions = get_course_versions([int(course_id)])
+            scope = f'{role}:{request.user.pk}' if role == STUDENT and self.cache_per_student else role
+        else:
+            # course list depends on all courses of the user
+            versions = get_course_versions(sorted(get_course_roles(request)))
+            scope = f'user:{request.user.pk}'
+        digest = hashlib.md5('|'.join([request.build_absolute_uri()] +
+                                      [f'{key}={value}' for key, value in sorted(versions.items())]).encode())
+        return f'response:{self.basename}:{self.action}:{scope}:{digest.hexdigest()}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            count(HIT)
+            return Response(data)
+        count(MISS)
+        with primary_reads():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
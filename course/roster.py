@@ -0,0 +1,178 @@
+import csv
+import io
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .counters import increment, recount_roster
+from .gradebook import sync_gradebook_students
+from .membership import invalidate_course_roles
+from .models import Course, CourseMembership
+from .response_cache import bump_course_versions
+
+BATCH_SIZE = 500
+# unknown and conflicting users are counted all, but only the first ones are listed in the report
+MAX_REPORTED_UNKNOWN = 100
+MAX_REPORTED_CONFLICTS = 100
+
+# set while memberships are changed as a set, per-row signal receivers leave the course state alone
+bulk_change = ContextVar('roster_bulk_change', default=False)
+
+
+@contextmanager
+def bulk_roster_change():
+    token = bulk_change.set(True)
+    try:
+        yield
+    finally:
+        bulk_change.reset(token)
+
+
+def iter_batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def iter_csv_identifiers(file):
+    """
+    Yield username or email from the first column of uploaded csv, line by line.
+    """
+    reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig'))
+    for line_number, row in enumerate(reader):
+        if not row or not row[0].strip():
+            continue
+        if line_number == 0 and row[0].strip().lower() in ('username', 'email'):
+            continue
+        yield row[0]
+
+
+def resolve_users(identifiers):
+    """
+    Return {user_id: username} for batch of usernames/emails and set of identifiers matching nobody.
+    """
+    users = {}
+    unknown = set(identifiers)
+    for user_id, username, email in User.objects.filter(Q(username__in=identifiers) | Q(email__in=identifiers))\
+            .values_list('id', 'username', 'email'):
+        users[user_id] = username
+        unknown.discard(username)
+        unknown.discard(email)
+    return users, unknown
+
+
+class RosterReport:
+
+    def __init__(self):
+        self.processed = 0
+        self.affected = 0
+        self.conflicts = []
+        self.conflict_count = 0
+        self.unknown = []
+        self.unknown_count = 0
+
+    def add_unknown(self, identifiers):
+        self.unknown_count += len(identifiers)
+        free = MAX_REPORTED_UNKNOWN - len(self.unknown)
+        self.unknown.extend(sorted(identifiers)[:max(free, 0)])
+
+    def add_conflict(self, username):
+        self.conflict_count += 1
+        if len(self.conflicts) < MAX_REPORTED_CONFLICTS:
+            self.conflicts.append(username)
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'affected': self.affected,
+            'conflicts': self.conflicts,
+            'conflict_count': self.conflict_count,
+            'unknown': self.unknown,
+            'unknown_count': self.unknown_count,
+        }
+
+
+def enroll(course, identifiers, role):
+    """
+    Add users given by usernames/emails to the course with the role, batch by batch.
+    Users which already have another role in the course are reported as conflicts.
+    """
+    report = RosterReport()
+    for batch in iter_batches(identifiers):
+        batch = {identifier.strip() for identifier in batch} - {''}
+        report.processed += len(batch)
+        users, unknown = resolve_users(batch)
+        report.add_unknown(unknown)
+        add_members(course, users, role, report)
+    finish_enroll(course, role, report)
+    return report
+
+
+def enroll_users(course, users, role):
+    """
+    Add users given as {user_id: username} to the course with the role, e.g. users just created by
+    users.provisioning, whose usernames could match emails of other users.
+    """
+    report = RosterReport()
+    report.processed = len(users)
+    add_members(course, users, role, report)
+    finish_enroll(course, role, report)
+    return report
+
+
+def add_members(course, users, role, report):
+    new_ids = set(users)
+    for user_id, current_role in CourseMembership.objects.filter(course=course, user_id__in=users)\
+            .values_list('user_id', 'role'):
+        new_ids.discard(user_id)
+        if current_role != role:
+            report.add_conflict(users[user_id])
+
+    CourseMembership.objects.bulk_create(
+        [CourseMembership(course=course, user_id=user_id, role=role) for user_id in new_ids],
+        ignore_conflicts=True,
+    )
+    invalidate_course_roles(new_ids)
+    report.affected += len(new_ids)
+
+
+def finish_enroll(course, role, report):
+    recount_roster([course.pk])
+    if report.affected and role == CourseMembership.STUDENT:
+        sync_gradebook_students(course.pk)
+    bump_course_versions([course.pk])
+
+
+def unenroll(course, identifiers, role):
+    """
+    Remove users given by usernames/emails with the role from the course, batch by batch.
+    """
+    report = RosterReport()
+    for batch in iter_batches(identifiers):
+        batch = {identifier.strip() for identifier in batch} - {''}
+        report.processed += len(batch)
+        users, unknown = resolve_users(batch)
+        report.add_unknown(unknown)
+
+        report.affected += remove_members(course, users, role)
+    return report
+
+
+def remove_members(course, user_ids, role):
+    """
+    Delete memberships of the users with the role as a set, then update counters, gradebook
+    and cached responses of the course once instead of once per deleted row.
+    """
+    user_ids = list(user_ids)
+    with bulk_roster_change():
+        deleted, _ = CourseMembership.objects.filter(course=course, role=role, user_id__in=user_ids).delete()
+    if deleted:
+        invalidate_course_roles(user_ids)
+        increment(Course, course.pk, **{f'{role}_count': -deleted})
+        if role == CourseMembership.STUDENT:
+            sync_gradebook_students(course.pk)
+        bump_course_versions([course.pk])
+    return deleted
@@ -0,0 +1,104 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections, router, transaction
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Course, Hometask, Lecture, SearchEntry
+from .resolvers import get_course_id
+
+# weights of title and body columns in sqlite bm25, title counts like postgres weight 'A' over 'B'
+SQLITE_RANK = "SELECT -bm25(course_searchentry_fts, 10.0, 1.0) FROM course_searchentry_fts " \
+              "WHERE course_searchentry_fts MATCH %s AND rowid = course_searchentry.id"
+SQLITE_MATCH = "SELECT rowid FROM course_searchentry_fts WHERE course_searchentry_fts MATCH %s"
+
+
+MODEL_KINDS = {
+    Course: SearchEntry.COURSE,
+    Lecture: SearchEntry.LECTURE,
+    Hometask: SearchEntry.HOMETASK,
+}
+
+
+def entry_fields(instance):
+    if isinstance(instance, Course):
+        return {'course_id': instance.id, 'lecture_id': None, 'title': instance.name,
+                'body': instance.description or ''}
+    if isinstance(instance, Lecture):
+        return {'course_id': instance.course_id, 'lecture_id': instance.id, 'title': instance.name, 'body': ''}
+    return {'course_id': get_course_id(instance), 'lecture_id': instance.lecture_id, 'title': '',
+            'body': instance.text}
+
+
+def index_object(instance):
+    """
+    Create or update the search entry of a course, lecture or hometask.
+    """
+    kind = MODEL_KINDS[type(instance)]
+    fields = entry_fields(instance)
+    # locks the entry in its own transaction, a concurrent first insert loses on the unique constraint
+    # and is retried as an update
+    SearchEntry.objects.update_or_create(kind=kind, object_id=instance.id, defaults=fields)
+
+
+def unindex_object(instance):
+    SearchEntry.objects.filter(kind=MODEL_KINDS[type(instance)], object_id=instance.id).delete()
+
+
+def rebuild_search_index():
+    """
+    Recreate all search entries with INSERT ... SELECT, e.g. after bulk loads which bypass signals.
+    """
+    entry = SearchEntry._meta.db_table
+    course = Course._meta.db_table
+    lecture = Lecture._meta.db_table
+    hometask = Hometask._meta.db_table
+    columns = f'INSERT INTO {entry} (kind, object_id, course_id, lecture_id, title, body) '
+    using = router.db_for_write(SearchEntry)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        SearchEntry.objects.using(using).all().delete()
+        cursor.execute(columns + f"SELECT %s, id, id, NULL, name, COALESCE(description, '') FROM {course}",
+                       [SearchEntry.COURSE])
+        cursor.execute(columns + f"SELECT %s, id, course_id, id, name, '' FROM {lecture}",
+                       [SearchEntry.LECTURE])
+        cursor.execute(columns + f"SELECT %s, h.id, l.course_id, l.id, '', h.text FROM {hometask} h "
+                                 f"JOIN {lecture} l ON l.id = h.lecture_id", [SearchEntry.HOMETASK])
+    return SearchEntry.objects.using(using).count()
+
+
+def fts_query(text):
+    """
+    Quote every word of the text as a prefix term, so user input cannot break the fts5 query syntax.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search(text, course_ids, kind=None):
+    """
+    Return search entries of the courses matching the text, best ranked first.
+    Postgres matches the GIN-indexed document with websearch syntax, sqlite the fts5 table with bm25,
+    other databases fall back to icontains.
+    """
+    queryset = SearchEntry.objects.filter(course_id__in=course_ids).defer('document')
+    if kind:
+        queryset = queryset.filter(kind=kind)
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(text, config='english', search_type='websearch')
+        queryset = queryset.filter(document=query).annotate(rank=SearchRank(F('document'), query))
+    elif vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.none()
+        queryset = queryset.filter(id__in=RawSQL(SQLITE_MATCH, [match]))\
+            .annotate(rank=RawSQL(SQLITE_RANK, [match], output_field=FloatField()))
+    else:
+        # no full-text index on other databases, every word must occur in title or body, unranked
+        words = re.findall(r'\w+', text)
+        if not words:
+            return queryset.none()
+        for word in words:
+            queryset = queryset.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        queryset = queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+    return queryset.order_by('-rank', 'id')
@@ -0,0 +1,117 @@
+"""
+Synthetic course data in realistic proportions for load tests and benchmarks.
+
+Rows are inserted with bulk_create, which skips model signals, so counters, cached roles and
+cached responses are brought up to date once at the end.
+"""
+import random
+import uuid
+from dataclasses import dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .counters import rebuild_counters
+from .membership import STUDENT, TEACHER, invalidate_course_roles
+from .models import (Comment, Course, CourseMembership, Hometask, Homework,
+                     Lecture)
+from .response_cache import bump_course_versions
+from .roster import iter_batches
+from .search import rebuild_search_index
+
+SEED_PASSWORD = 'seed-password'
+
+
+@dataclass
+class SeedScale:
+    courses: int = 100
+    users: int = 2000
+    teachers_per_course: int = 2
+    students_per_course: int = 30
+    lectures_per_course: int = 8
+    hometasks_per_lecture: int = 2
+    # share of students who hand in each hometask, and of homework that is graded
+    submission_rate: float = 0.6
+    graded_rate: float = 0.5
+    comments_per_homework: int = 1
+    batch_size: int = 2000
+
+    def scaled(self, factor):
+        return SeedScale(**{**self.__dict__, 'courses': self.courses * factor, 'users': self.users * factor})
+
+
+def bulk_insert(model, objects, batch_size):
+    created = []
+    for batch in iter_batches(objects, batch_size):
+        created.extend(model.objects.bulk_create(batch))
+    return created
+
+
+def seed(scale, rng=None):
+    """
+    Create users, courses with rosters, lectures, hometasks, homework and comments.
+    Return {model name: rows created}. All users get SEED_PASSWORD.
+    """
+    rng = rng or random.Random()
+    run = uuid.uuid4().hex[:8]
+    password = make_password(SEED_PASSWORD)
+    size = scale.batch_size
+
+    with transaction.atomic():
+        users = bulk_insert(User, (
+            User(username=f'seed-{run}-{i}', email=f'seed-{run}-{i}@example.com', password=password,
+                 first_name='Seed', last_name=str(i))
+            for i in range(scale.users)
+        ), size)
+        courses = bulk_insert(Course, (
+            Course(name=f'Course {i}'[:15], slug=f'seed-{run}-{i}', description='Generated course.')
+            for i in range(scale.courses)
+        ), size)
+
+        memberships = []
+        students = {}
+        for course in courses:
+            picked = rng.sample(users, min(len(users), scale.teachers_per_course + scale.students_per_course))
+            students[course.id] = picked[scale.teachers_per_course:]
+            memberships.extend(CourseMembership(course=course, user=user, role=TEACHER)
+                               for user in picked[:scale.teachers_per_course])
+            memberships.extend(CourseMembership(course=course, user=user, role=STUDENT)
+                               for user in students[course.id])
+        bulk_insert(CourseMembership, memberships, size)
+
+        lectures = bulk_insert(Lecture, (
+            Lecture(course=course, name=f'Lecture {i}', file=f'seed/lecture-{i}.pdf')
+            for course in courses for i in range(scale.lectures_per_course)
+        ), size)
+        hometasks = bulk_insert(Hometask, (
+            Hometask(lecture=lecture, text=f'Hometask {i} of {lecture.name}.', max_mark=10)
+            for lecture in lectures for i in range(scale.hometasks_per_lecture)
+        ), size)
+        course_of_lecture = {lecture.id: lecture.course_id for lecture in lectures}
+
+        homework = bulk_insert(Homework, (
+            Homework(hometask=hometask, student=student, file=f'seed/homework-{hometask.id}-{student.id}.pdf',
+                     mark=rng.randint(0, hometask.max_mark) if rng.random() < scale.graded_rate else None)
+            for hometask in hometasks for student in students[course_of_lecture[hometask.lecture_id]]
+            if rng.random() < scale.submission_rate
+        ), size)
+        comments = bulk_insert(Comment, (
+            Comment(homework=item, owner=item.student, text='Please take a look.')
+            for item in homework for _ in range(scale.comments_per_homework)
+        ), size)
+
+        rebuild_counters()
+        rebuild_search_index()
+
+    invalidate_course_roles([user.id for user in users])
+    bump_course_versions([course.id for course in courses])
+    return {
+        'users': len(users),
+        'courses': len(courses),
+        'memberships': len(memberships),
+        'lectures': len(lectures),
+        'hometasks': len(hometasks),
+        'homework': len(homework),
+        'comments': len(comments),
+    }
@@ -1,68 +1,90 @@
-from rest_framework import serializers
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions, serializers
 
-from .models import Comment, Course, Hometask, Homework, Lecture
+from courses_site.metrics import TimedRepresentationMixin
 
+from .counters import increment
+from .gradebook import update_gradebook_cells
+from .membership import STUDENT, TEACHER, get_course_role, has_role_conflict
+from .models import (Comment, Course, CourseMembership, Hometask, Homework,
+                     Lecture, Notification, SearchEntry, UploadSession)
+from .response_cache import bump_course_versions
+from .uploads import reuse_stored_file
 
-class CourseSerializer(serializers.ModelSerializer):
-    teachers = serializers.StringRelatedField(many=True, required=False)
-    students = serializers.StringRelatedField(many=True, required=False)
+
+class CourseSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        fields = '__all__'
+        exclude = ('members',)
 
     def create(self, validated_data):
         user = self.context['request'].user
-        validated_data['teachers'].append(user.id)
         instance = super().create(validated_data)
+        instance.members.add(user, through_defaults={'role': TEACHER})
+        instance.teacher_count = 1
+        instance.student_count = 0
         return instance
 
-    # prevent teachers/students fields from being updated
-    def update(self, instance, validated_data):
-        validated_data.pop('teachers', None)
-        validated_data.pop('students', None)
-        return super().update(instance, validated_data)
+
+class CourseMemberSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(source='user.id')
+    username = serializers.CharField(source='user.username')
+    first_name = serializers.CharField(source='user.first_name')
+    last_name = serializers.CharField(source='user.last_name')
+
+    class Meta:
+        model = CourseMembership
+        fields = ('id', 'username', 'first_name', 'last_name', 'role')
 
 
-class AddTeacherSerializer(serializers.ModelSerializer):
+class AddTeacherSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    teachers = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all())
 
     class Meta:
         model = Course
         fields = ('teachers',)
 
     def validate(self, attrs):
-        teachers = attrs.get('teachers', self.instance.teachers.all())
-        students = attrs.get('students', self.instance.students.all())
-        if set(teachers).intersection(students):
+        if has_role_conflict(self.instance, attrs['teachers'], TEACHER):
             raise serializers.ValidationError({"teachers": "The same user cannot be both teacher and student."})
         return attrs
 
     def update(self, instance, validated_data):
-        for teacher in validated_data['teachers']:
-            instance.teachers.add(teacher.id)
+        instance.members.add(*validated_data['teachers'], through_defaults={'role': TEACHER})
         return instance
 
 
-class AddDeleteStudentSerializer(serializers.ModelSerializer):
+class AddDeleteStudentSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    students = serializers.PrimaryKeyRelatedField(many=True, queryset=User.objects.all())
 
     class Meta:
         model = Course
         fields = ('students',)
 
     def validate(self, attrs):
-        teachers = attrs.get('teachers', self.instance.teachers.all())
-        students = attrs.get('students', self.instance.students.all())
-        if set(teachers).intersection(students):
+        if has_role_conflict(self.instance, attrs['students'], STUDENT):
             raise serializers.ValidationError({"students": "The same user cannot be both teacher and student."})
         return attrs
 
     def update(self, instance, validated_data):
-        for student in validated_data['students']:
-            instance.students.add(student.id)
+        instance.members.add(*validated_data['students'], through_defaults={'role': STUDENT})
         return instance
 
 
-class LectureSerializer(serializers.ModelSerializer):
+class RosterSerializer(serializers.Serializer):
+    role = serializers.ChoiceField(choices=CourseMembership.ROLE_CHOICES, default=STUDENT)
+    users = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+
+class RosterImportSerializer(serializers.Serializer):
+    role = serializers.ChoiceField(choices=CourseMembership.ROLE_CHOICES, default=STUDENT)
+    file = serializers.FileField()
+
+
+class LectureSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     course = serializers.StringRelatedField()
 
     class Meta:
@@ -70,8 +92,7 @@ class LectureSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def create(self, validated_data):
-        course_id = self.context['view'].kwargs['course_pk']
-        validated_data['course'] = Course.objects.get(id=course_id)
+        validated_data['course'] = self.context['view'].route_chain.course
         instance = super().create(validated_data)
         return instance
 
@@ -81,7 +102,7 @@ class LectureSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class HometaskSerializer(serializers.ModelSerializer):
+class HometaskSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     lecture = serializers.StringRelatedField()
 
     class Meta:
@@ -89,8 +110,7 @@ class HometaskSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def create(self, validated_data):
-        lecture_id = self.context['view'].kwargs['lecture_pk']
-        validated_data['lecture'] = Lecture.objects.get(id=lecture_id)
+        validated_data['lecture'] = self.context['view'].route_chain.lecture
         instance = super().create(validated_data)
         return instance
 
@@ -100,7 +120,7 @@ class HometaskSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class HomeworkSerializer(serializers.ModelSerializer):
+class HomeworkSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     hometask = serializers.StringRelatedField()
     student = serializers.StringRelatedField()
 
@@ -110,8 +130,7 @@ class HomeworkSerializer(serializers.ModelSerializer):
         read_only_fields = ['mark']
 
     def create(self, validated_data):
-        hometask_id = self.context['view'].kwargs['hometask_pk']
-        validated_data['hometask'] = Hometask.objects.get(id=hometask_id)
+        validated_data['hometask'] = self.context['view'].route_chain.hometask
         validated_data['student'] = self.context['request'].user
         instance = super().create(validated_data)
         return instance
@@ -123,19 +142,62 @@ class HomeworkSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class MarkSerializer(serializers.ModelSerializer):
+class MarkSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Homework
         fields = ('mark',)
 
     def validate(self, attrs):
-        if attrs['mark'] > self.instance.hometask.max_mark:
+        if attrs['mark'] > self.context['view'].route_chain.hometask.max_mark:
             raise serializers.ValidationError({"mark": "Mark cannot be more than Maximum mark for task."})
         return attrs
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class MarkItemSerializer(serializers.Serializer):
+    homework_id = serializers.IntegerField()
+    mark = serializers.IntegerField(min_value=0)
+
+
+class BulkMarkSerializer(serializers.Serializer):
+    marks = MarkItemSerializer(many=True, allow_empty=False)
+
+    def validate_marks(self, value):
+        homework_ids = [item['homework_id'] for item in value]
+        if len(homework_ids) != len(set(homework_ids)):
+            raise serializers.ValidationError("Each homework can be marked only once.")
+        return value
+
+    def create(self, validated_data):
+        hometask = self.context['view'].route_chain.hometask
+        marks = {item['homework_id']: item['mark'] for item in validated_data['marks']}
+        errors = []
+        marked = []
+        now = timezone.now()
+        with transaction.atomic():
+            homeworks = Homework.objects.select_for_update().filter(hometask=hometask, id__in=marks)\
+                .only('id', 'student', 'mark', 'created').in_bulk()
+            for homework_id, mark in marks.items():
+                homework = homeworks.get(homework_id)
+                if homework is None:
+                    errors.append({'homework_id': homework_id, 'error': "Homework not found."})
+                elif mark > hometask.max_mark:
+                    errors.append({'homework_id': homework_id,
+                                   'error': "Mark cannot be more than Maximum mark for task."})
+                else:
+                    homework.mark = mark
+                    homework.created = now
+                    marked.append(homework)
+            Homework.objects.bulk_update(marked, ['mark', 'created'])
+            newly_graded = sum(homework._stored_mark is None for homework in marked)
+            increment(Hometask, hometask.id, graded_count=newly_graded)
+            update_gradebook_cells(hometask.lecture.course_id,
+                                   [(homework.student_id, hometask.id) for homework in marked])
+            bump_course_versions([hometask.lecture.course_id])
+        return {'marked': [homework.id for homework in marked], 'errors': errors}
+
+
+class CommentSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     homework = serializers.StringRelatedField()
     owner = serializers.StringRelatedField()
 
@@ -145,8 +207,7 @@ class CommentSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        homework_id = self.context['view'].kwargs['homework_pk']
-        homework_obj = Homework.objects.get(id=homework_id)
+        homework_obj = self.context['view'].route_chain.homework
         if not homework_obj.mark:
             raise Exception("Mark is null. You can leave comments only on the mark.")
 
@@ -160,3 +221,50 @@ class CommentSerializer(serializers.ModelSerializer):
         validated_data.pop('homework', None)
         validated_data.pop('owner', None)
         return super().update(instance, validated_data)
+
+
+class UploadSessionSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'lecture', 'homework', 'filename', 'size', 'offset', 'sha256', 'completed')
+        read_only_fields = ('offset', 'completed')
+
+    def validate(self, attrs):
+        lecture = attrs.get('lecture')
+        homework = attrs.get('homework')
+        if bool(lecture) == bool(homework):
+            raise serializers.ValidationError("Exactly one of lecture or homework is required.")
+        request = self.context['request']
+        if lecture and get_course_role(request, lecture.course_id) != TEACHER:
+            raise exceptions.PermissionDenied("Only teachers of the course can upload lecture files.")
+        if homework and homework.student_id != request.user.id:
+            raise exceptions.PermissionDenied("Only owner of the homework can upload its file.")
+        return attrs
+
+    def create(self, validated_data):
+        validated_data['owner'] = self.context['request'].user
+        instance = super().create(validated_data)
+        reuse_stored_file(instance)
+        return instance
+
+
+class NotificationSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+
+    class Meta:
+        model = Notification
+        exclude = ('user',)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    kind = serializers.ChoiceField(choices=SearchEntry.KIND_CHOICES, required=False)
+
+
+class SearchResultSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(source='object_id')
+    rank = serializers.FloatField()
+
+    class Meta:
+        model = SearchEntry
+        fields = ('kind', 'id', 'course', 'lecture', 'title', 'body', 'rank')
@@ -0,0 +1,243 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+
+from .counters import increment, recount_roster
+from .gradebook import (drop_gradebook, sync_gradebook_students,
+                        update_gradebook_cells)
+from .membership import invalidate_course_roles
+from .models import (Comment, Course, CourseMembership, Hometask, Homework,
+                     Lecture, Notification)
+from .resolvers import get_course_id
+from .response_cache import bump_course_versions
+from .roster import bulk_change
+from .search import index_object, unindex_object
+from .task import publish_notification
+
+
+@receiver(post_save, sender=CourseMembership)
+@receiver(post_delete, sender=CourseMembership)
+def invalidate_membership_roles(sender, instance, **kwargs):
+    if not bulk_change.get():
+        invalidate_course_roles([instance.user_id])
+
+
+@receiver(post_save, sender=CourseMembership)
+def count_added_member(sender, instance, created, **kwargs):
+    if created and not bulk_change.get():
+        increment(Course, instance.course_id, **{f'{instance.role}_count': 1})
+
+
+@receiver(post_delete, sender=CourseMembership)
+def count_removed_member(sender, instance, **kwargs):
+    # set deletes of course.roster update the course once for all rows
+    if not bulk_change.get():
+        increment(Course, instance.course_id, **{f'{instance.role}_count': -1})
+
+
+@receiver(m2m_changed, sender=Course.members.through)
+def count_bulk_added_members(sender, instance, action, reverse, pk_set, **kwargs):
+    # add() inserts through rows without post_save, removal deletes them one by one with post_delete
+    if action == 'post_add' and pk_set:
+        recount_roster(pk_set if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Course.members.through)
+def invalidate_roster_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_course_roles([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_course_roles(instance.memberships.values_list('user_id', flat=True))
+    else:
+        invalidate_course_roles(pk_set)
+
+
+@receiver(post_save, sender=CourseMembership)
+@receiver(post_delete, sender=CourseMembership)
+def sync_gradebook_roster(sender, instance, **kwargs):
+    if instance.role == CourseMembership.STUDENT and not bulk_change.get():
+        sync_gradebook_students(instance.course_id)
+
+
+@receiver(m2m_changed, sender=Course.members.through)
+def sync_bulk_gradebook_roster(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove'):
+        return
+    if not reverse:
+        sync_gradebook_students(instance.pk)
+    else:
+        for course_id in pk_set or ():
+            sync_gradebook_students(course_id)
+
+
+@receiver(pre_delete, sender=Course)
+def invalidate_deleted_course_roles(sender, instance, **kwargs):
+    invalidate_course_roles(instance.memberships.values_list('user_id', flat=True))
+
+
+def stored_file_name(instance):
+    # read without the descriptor, so deferred file field is not loaded
+    value = instance.__dict__.get('file')
+    return getattr(value, 'name', value)
+
+
+@receiver(post_init, sender=Lecture)
+@receiver(post_init, sender=Homework)
+def remember_file_name(sender, instance, **kwargs):
+    instance._stored_file_name = stored_file_name(instance)
+
+
+def release_file(storage, name):
+    # the row change may be rolled back, so the reference is dropped only after commit
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_save, sender=Lecture)
+@receiver(post_save, sender=Homework)
+def release_replaced_file(sender, instance, **kwargs):
+    name = stored_file_name(instance)
+    if instance._stored_file_name and instance._stored_file_name != name:
+        release_file(instance.file.storage, instance._stored_file_name)
+    instance._stored_file_name = name
+
+
+@receiver(post_delete, sender=Lecture)
+@receiver(post_delete, sender=Homework)
+def release_deleted_file(sender, instance, **kwargs):
+    name = stored_file_name(instance)
+    if name:
+        release_file(instance.file.storage, name)
+
+
+@receiver(post_init, sender=Homework)
+def remember_mark(sender, instance, **kwargs):
+    instance._stored_mark = instance.__dict__.get('mark')
+
+
+@receiver(post_save, sender=Homework)
+def update_homework_aggregates_on_save(sender, instance, created, **kwargs):
+    graded = instance.mark is not None
+    was_graded = not created and instance._stored_mark is not None
+    increment(Hometask, instance.hometask_id, homework_count=int(created), graded_count=graded - was_graded)
+    if created or instance.mark != instance._stored_mark:
+        course_id = get_course_id(instance)
+        if course_id:
+            update_gradebook_cells(course_id, [(instance.student_id, instance.hometask_id)])
+    instance._stored_mark = instance.mark
+
+
+@receiver(post_delete, sender=Homework)
+def update_homework_aggregates_on_delete(sender, instance, **kwargs):
+    increment(Hometask, instance.hometask_id, homework_count=-1, graded_count=-int(instance.mark is not None))
+    course_id = get_course_id(instance)
+    if course_id:
+        update_gradebook_cells(course_id, [(instance.student_id, instance.hometask_id)])
+
+
+@receiver(post_save, sender=Hometask)
+@receiver(post_delete, sender=Hometask)
+def drop_gradebook_on_hometask_change(sender, instance, **kwargs):
+    course_id = get_course_id(instance)
+    if course_id:
+        drop_gradebook(course_id)
+
+
+@receiver(post_save, sender=Lecture)
+def count_added_lecture(sender, instance, created, **kwargs):
+    if created:
+        increment(Course, instance.course_id, lecture_count=1)
+
+
+@receiver(post_delete, sender=Lecture)
+def count_removed_lecture(sender, instance, **kwargs):
+    increment(Course, instance.course_id, lecture_count=-1)
+
+
+@receiver(post_save, sender=Hometask)
+def count_added_hometask(sender, instance, created, **kwargs):
+    if created:
+        increment(Lecture, instance.lecture_id, hometask_count=1)
+
+
+@receiver(post_delete, sender=Hometask)
+def count_removed_hometask(sender, instance, **kwargs):
+    increment(Lecture, instance.lecture_id, hometask_count=-1)
+
+
+@receiver(post_save, sender=Lecture)
+def notify_about_lecture(sender, instance, created, **kwargs):
+    if created:
+        text = f'New lecture "{instance.name}" was published.'
+        transaction.on_commit(lambda: publish_notification.delay(
+            instance.course_id, Notification.LECTURE, instance.id, text))
+
+
+@receiver(post_save, sender=Hometask)
+def notify_about_hometask(sender, instance, created, **kwargs):
+    if created:
+        course_id = get_course_id(instance)
+        text = f'New hometask was published for lecture {instance.lecture_id}.'
+        transaction.on_commit(lambda: publish_notification.delay(
+            course_id, Notification.HOMETASK, instance.id, text))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def evict_course_responses(sender, instance, **kwargs):
+    bump_course_versions([instance.pk])
+
+
+@receiver(post_save, sender=CourseMembership)
+@receiver(post_delete, sender=CourseMembership)
+@receiver(post_save, sender=Lecture)
+@receiver(post_delete, sender=Lecture)
+def evict_course_child_responses(sender, instance, **kwargs):
+    if not (sender is CourseMembership and bulk_change.get()):
+        bump_course_versions([instance.course_id])
+
+
+@receiver(m2m_changed, sender=Course.members.through)
+def evict_roster_responses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_course_versions([instance.pk])
+    elif action == 'pre_clear':
+        bump_course_versions(list(instance.course_memberships.values_list('course_id', flat=True)))
+    else:
+        bump_course_versions(pk_set)
+
+
+@receiver(post_save, sender=Hometask)
+@receiver(post_delete, sender=Hometask)
+def evict_hometask_responses(sender, instance, **kwargs):
+    bump_course_versions([get_course_id(instance)])
+
+
+@receiver(post_save, sender=Homework)
+@receiver(post_delete, sender=Homework)
+def evict_homework_responses(sender, instance, **kwargs):
+    bump_course_versions([get_course_id(instance)])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def evict_comment_responses(sender, instance, **kwargs):
+    bump_course_versions(Homework.objects.filter(pk=instance.homework_id)
+                         .values_list('hometask__lecture__course_id', flat=True))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lecture)
+@receiver(post_save, sender=Hometask)
+def index_search_entry(sender, instance, **kwargs):
+    index_object(instance)
+
+
+# entries of courses and lectures are deleted with them by the foreign key cascade
+@receiver(post_delete, sender=Hometask)
+def unindex_search_entry(sender, instance, **kwargs):
+    unindex_object(instance)
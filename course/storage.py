@@ -0,0 +1,107 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+
+
+class HashingFile(File):
+    """
+    File which computes sha256 of the content while storage reads it.
+    """
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size):
+            self.sha256.update(chunk)
+            yield chunk
+
+
+def blob_name(sha256, name):
+    extension = os.path.splitext(name)[1].lower()
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under sha256 of their content, so identical uploads share one blob.
+    Every save adds a reference to the blob and every delete drops one; the blob is
+    removed from disk with the last reference. Files not stored as blobs are never deleted.
+    """
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        if not isinstance(content, HashingFile):
+            content = HashingFile(content, name)
+        # hash while writing to a temporary name, then move to the content address
+        tmp_name = super()._save(f'{BLOB_DIR}/tmp/{uuid.uuid4().hex}', content)
+        sha256 = content.sha256.hexdigest()
+        name = blob_name(sha256, name)
+        size = self.size(tmp_name)
+        with transaction.atomic():
+            # the blob row lock is held by delete() while it removes the last reference and the file,
+            # so the file check below cannot race with its removal
+            blob = None
+            while blob is None:
+                StoredBlob.objects.get_or_create(name=name, defaults={'sha256': sha256, 'size': size})
+                blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if self.exists(name):
+                os.remove(self.path(tmp_name))
+            else:
+                os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+                os.replace(self.path(tmp_name), self.path(name))
+            StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+        return name
+
+    def reuse(self, sha256, name, size):
+        """
+        Add reference to already stored blob with the content, return its name or None.
+        """
+        from .models import StoredBlob
+
+        name = blob_name(sha256, name)
+        if not StoredBlob.objects.filter(name=name, size=size).update(refcount=F('refcount') + 1):
+            return None
+        return name
+
+    def delete(self, name):
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.refcount > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
+
+
+class OriginalNameFieldFile(FieldFile):
+
+    def save(self, name, content, save=True):
+        # the storage names the file by its content, the uploaded name is kept for downloads
+        self.instance.filename = os.path.basename(name)[:255]
+        super().save(name, content, save)
+
+
+class ContentFileField(models.FileField):
+    """
+    FileField in the content-addressed storage which keeps the uploaded name in the `filename` field
+    of the model. Files attached without saving them (upload sessions) set `filename` themselves.
+    """
+    attr_class = OriginalNameFieldFile
@@ -0,0 +1,35 @@
+from celery import group, shared_task
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from users.outbox import enqueue_emails
+
+from .models import CourseMembership, Notification
+from .roster import iter_batches
+from .uploads import expire_uploads
+
+
+@shared_task()
+def publish_notification(course_id, kind, object_id, text):
+    """
+    Split course students into fixed size chunks and notify every chunk in a separate task.
+    """
+    student_ids = CourseMembership.objects.filter(course_id=course_id, role=CourseMembership.STUDENT)\
+        .order_by('user_id').values_list('user_id', flat=True)
+    chunks = iter_batches(student_ids.iterator(), settings.NOTIFICATION_CHUNK_SIZE)
+    group(notify_students.s(chunk, course_id, kind, object_id, text) for chunk in chunks).apply_async()
+
+
+@shared_task()
+def notify_students(student_ids, course_id, kind, object_id, text):
+    Notification.objects.bulk_create([
+        Notification(user_id=student_id, course_id=course_id, kind=kind, object_id=object_id, text=text)
+        for student_id in student_ids
+    ])
+    emails = User.objects.filter(id__in=student_ids).exclude(email='').values_list('email', flat=True)
+    enqueue_emails(emails, 'Course update', text)
+
+
+@shared_task()
+def expire_upload_sessions():
+    return expire_uploads()
@@ -1,10 +1,12 @@
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from model_bakery import baker
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from course.models import Course
+from course.models import Course, Hometask, Lecture
+from courses_site.celery import app as celery_app
 
 
 @pytest.fixture
@@ -59,5 +61,31 @@ def course_data(test_user):
 @pytest.fixture
 def course(test_user, course_data):
     course = baker.make(Course)
-    course.teachers.add(test_user)
+    course.members.add(test_user, through_defaults={'role': 'teacher'})
     return course
+
+
+@pytest.fixture
+def lecture(course):
+    return baker.make(Lecture, course=course)
+
+
+@pytest.fixture
+def hometask(lecture):
+    return baker.make(Hometask, lecture=lecture)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    for cache in caches.all():
+        cache.clear()
+    yield
+    for cache in caches.all():
+        cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def celery_eager():
+    celery_app.conf.task_always_eager = True
+    yield
+    celery_app.conf.task_always_eager = False
@@ -0,0 +1,321 @@
+"""
+Query-count and latency benchmarks of the API routes on seeded data of several sizes.
+
+Every route is requested once with empty caches under django_assert_num_queries, so N+1 regressions fail
+the suite at any data size, then timed over warm requests. Sizes are multipliers of BENCH_SCALE:
+
+    BENCHMARK_SIZES=1,5,20 BENCHMARK_OUTPUT=bench.json python -m pytest course/tests/test_benchmarks.py
+
+By default sizes 1 and 2 are timed over 100 requests per route, enough for p99. BENCHMARK_ITERATIONS=5 only
+checks query counts and gives p50 and max, in a fraction of the time.
+
+Results (queries, p50, p99 and max in ms per route and size) are written as JSON to BENCHMARK_OUTPUT. Routes of course/urls.py and users/urls.py are all covered except file downloads,
+seeded rows point to files that do not exist.
+"""
+import json
+import os
+import random
+import time
+import uuid
+from collections import namedtuple
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from course.membership import STUDENT, TEACHER
+from course.models import (Comment, Course, CourseMembership, Hometask,
+                           Homework, Lecture, UploadSession)
+from course.seeding import SEED_PASSWORD, SeedScale, seed
+from course.uploads import part_path
+from users.models import UserImport
+
+BENCH_SCALE = SeedScale(courses=3, users=40, teachers_per_course=1, students_per_course=20,
+                        lectures_per_course=3, hometasks_per_lecture=2, comments_per_homework=1)
+# fewer samples only give the maximum, not a meaningful 99th percentile
+MIN_P99_SAMPLES = 100
+SIZES = [int(size) for size in os.environ.get('BENCHMARK_SIZES', '1,2').split(',')]
+ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', MIN_P99_SAMPLES))
+
+RESULTS = {}
+
+
+def scale_for(size):
+    return SeedScale(**{**BENCH_SCALE.__dict__, 'courses': BENCH_SCALE.courses * size,
+                        'users': BENCH_SCALE.users * size,
+                        'students_per_course': BENCH_SCALE.students_per_course * size})
+
+
+def client_for(user):
+    client = APIClient()
+    if user is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+class Seeded:
+    """
+    Objects of the first seeded course, seen from its teacher and from a student with homework.
+    """
+
+    def __init__(self, size):
+        seed(scale_for(size), random.Random(0))
+        self.course = Course.objects.order_by('-id').first()
+        self.teacher = User.objects.get(course_memberships__course=self.course,
+                                        course_memberships__role=TEACHER)
+        # graded, comments can only be left on marked homework
+        self.homework = Homework.objects.filter(hometask__lecture__course=self.course, mark__gt=0)\
+            .select_related('hometask__lecture').order_by('id').first()
+        # marks sent by the benchmark differ from it, so every mark request changes the gradebook
+        Homework.objects.filter(pk=self.homework.pk).update(mark=self.homework.hometask.max_mark)
+        self.student = self.homework.student
+        self.hometask = self.homework.hometask
+        self.lecture = self.hometask.lecture
+        self.comment = Comment.objects.filter(homework=self.homework).first()
+        self.admin = User.objects.create_user('bench-admin', password=SEED_PASSWORD, is_staff=True)
+        self.outsider = User.objects.exclude(course_memberships__course=self.course).exclude(is_staff=True).first()
+
+    def new_user(self, prefix, i):
+        return User.objects.create(username=f'{prefix}-{i}-{uuid.uuid4().hex[:8]}')
+
+    def new_student(self, prefix, i):
+        user = self.new_user(prefix, i)
+        CourseMembership.objects.create(course=self.course, user=user, role=STUDENT)
+        return user
+
+    def new_course(self, i):
+        course = Course.objects.create(name=f'Bench {i}', slug=f'bench-{uuid.uuid4().hex}')
+        course.members.add(self.teacher, through_defaults={'role': TEACHER})
+        return course
+
+    def new_upload(self, offset=0):
+        session = UploadSession.objects.create(owner=self.student, homework=self.homework, filename='work.pdf',
+                                               size=10, offset=offset)
+        if offset:
+            os.makedirs(os.path.dirname(part_path(session)), exist_ok=True)
+            with open(part_path(session), 'wb') as part:
+                part.write(b'0' * offset)
+        return session
+
+    def course_kwargs(self, **kwargs):
+        return {'course_pk': self.course.id, **kwargs}
+
+    def lecture_kwargs(self, **kwargs):
+        return self.course_kwargs(lecture_pk=self.lecture.id, **kwargs)
+
+    def hometask_kwargs(self, **kwargs):
+        return self.lecture_kwargs(hometask_pk=self.hometask.id, **kwargs)
+
+    def homework_kwargs(self, **kwargs):
+        return self.hometask_kwargs(homework_pk=self.homework.id, **kwargs)
+
+
+# prepare(data, iteration) returns (client, method, url, body, format, extra request kwargs)
+Route = namedtuple('Route', ('name', 'queries', 'prepare'))
+
+
+def get(user_attr, url_name, kwargs=None):
+    return send(user_attr, 'get', url_name, kwargs)
+
+
+def send(user_attr, method, url_name, kwargs=None, body=None, format='json', setup=None, extra=None):
+    """
+    setup(data, iteration) creates the object a write consumes (e.g. a row to delete) as `data.fresh`.
+    """
+    def prepare(data, i):
+        if setup:
+            data.fresh = setup(data, i)
+        user = getattr(data, user_attr) if user_attr else None
+        url = reverse(url_name, kwargs=kwargs(data) if kwargs else None)
+        return client_for(user), method, url, body(data, i) if body else None, format, extra or {}
+    return prepare
+
+
+def logout(data, i):
+    refresh = RefreshToken.for_user(data.student)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+    return client, 'post', reverse('logout'), {'refresh_token': str(refresh)}, 'json', {}
+
+
+def import_report(data, i):
+    return UserImport.objects.create(content=b'').pk
+
+
+def csv_file(name, content):
+    return SimpleUploadedFile(name, content.encode(), content_type='text/csv')
+
+
+def pdf_file(name):
+    return SimpleUploadedFile(name, b'%PDF-1.4 bench', content_type='application/pdf')
+
+
+ROUTES = [
+    # users
+    Route('login', 1, send(None, 'post', 'token_obtain_pair',
+                           body=lambda d, i: {'username': d.student.username, 'password': SEED_PASSWORD})),
+    Route('refresh', 0, send(None, 'post', 'token_refresh',
+                             body=lambda d, i: {'refresh': str(RefreshToken.for_user(d.student))})),
+    Route('register', 5, send(None, 'post', 'register', body=lambda d, i: {
+        'username': f'bench-{i}', 'email': f'bench-{i}@example.com', 'password': 'Str0ng-pass-1',
+        'password2': 'Str0ng-pass-1', 'first_name': 'Bench', 'last_name': str(i)})),
+    Route('change_password', 3, send('student', 'put', 'change_password', lambda d: {'pk': d.student.id},
+                                     lambda d, i: {'old_password': SEED_PASSWORD, 'password': SEED_PASSWORD,
+                                                   'password2': SEED_PASSWORD})),
+    Route('update_profile', 3, send('student', 'patch', 'update_profile', lambda d: {'pk': d.student.id},
+                                    lambda d, i: {'first_name': f'Student {i}'})),
+    Route('logout', 1, logout),
+    Route('import_users_status', 2, send('admin', 'get', 'import-users-status', lambda d: {'import_id': d.fresh},
+                                         setup=import_report)),
+    # stores the csv and enqueues the import task after commit, which the test transaction never reaches
+    Route('import_users', 2, send('admin', 'post', 'import-users', body=lambda d, i: {
+        'file': csv_file('users.csv', f'username,email,password,first_name,last_name\n'
+                                      f'imported-{i},imported-{i}@example.com,Str0ng-pass-1,,\n'),
+        'send_welcome': False}, format='multipart')),
+    # course
+    Route('notifications', 2, get('student', 'notifications')),
+    Route('search', 4, send('student', 'get', 'search', body=lambda d, i: {'q': f'hometask {i % 2}'})),
+    Route('response_cache_stats', 1, get('admin', 'response-cache-stats')),
+    Route('course_list', 5, get('teacher', 'course-list')),
+    Route('course_detail', 4, get('teacher', 'course-detail', lambda d: {'pk': d.course.id})),
+    Route('course_create', 19, send('teacher', 'post', 'course-list', body=lambda d, i: {
+        'name': f'Bench {i}', 'slug': f'bench-{uuid.uuid4().hex}'})),
+    Route('course_update', 8, send('teacher', 'patch', 'course-detail', lambda d: {'pk': d.course.id},
+                                   lambda d, i: {'description': f'Updated {i}'})),
+    Route('course_destroy', 11, send('teacher', 'delete', 'course-detail', lambda d: {'pk': d.fresh.id},
+                                    setup=lambda d, i: d.new_course(i))),
+    Route('course_members', 4, get('teacher', 'course-members', lambda d: {'pk': d.course.id})),
+    Route('gradebook', 13, get('teacher', 'gradebook', lambda d: {'pk': d.course.id})),
+    Route('add_teacher', 4, get('teacher', 'add-teacher', lambda d: {'pk': d.course.id})),
+    Route('add_teacher_update', 14, send('teacher', 'put', 'add-teacher', lambda d: {'pk': d.course.id},
+                                        lambda d, i: {'teachers': [d.fresh.id]},
+                                        setup=lambda d, i: d.new_user('teacher', i))),
+    Route('add_delete_student', 4, get('teacher', 'add-delete-student', lambda d: {'pk': d.course.id})),
+    Route('add_student', 14, send('teacher', 'put', 'add-delete-student', lambda d: {'pk': d.course.id},
+                                 lambda d, i: {'students': [d.fresh.id]},
+                                 setup=lambda d, i: d.new_user('student', i))),
+    Route('remove_student', 13, send('teacher', 'delete', 'add-delete-student', lambda d: {'pk': d.course.id},
+                                    lambda d, i: {'students': [d.fresh.id]},
+                                    setup=lambda d, i: d.new_student('removed', i))),
+    Route('roster', 12, send('teacher', 'post', 'roster', lambda d: {'pk': d.course.id},
+                            lambda d, i: {'users': [d.outsider.username], 'role': STUDENT})),
+    Route('roster_remove', 12, send('teacher', 'delete', 'roster', lambda d: {'pk': d.course.id},
+                                   lambda d, i: {'users': [d.fresh.username], 'role': STUDENT},
+                                   setup=lambda d, i: d.new_student('unenrolled', i))),
+    Route('roster_import', 6, send('teacher', 'post', 'roster-import', lambda d: {'pk': d.course.id},
+                                   lambda d, i: {'file': csv_file('roster.csv', d.outsider.username),
+                                                 'role': STUDENT}, format='multipart')),
+    Route('upload_create', 3, send('student', 'post', 'upload-list', body=lambda d, i: {
+        'homework': d.homework.id, 'filename': 'work.pdf', 'size': 10})),
+    Route('upload_detail', 2, send('student', 'get', 'upload-detail', lambda d: {'pk': d.fresh.id},
+                                   setup=lambda d, i: d.new_upload())),
+    Route('upload_chunk', 6, send('student', 'put', 'upload-detail', lambda d: {'pk': d.fresh.id},
+                                  lambda d, i: b'0123456789', format=None, setup=lambda d, i: d.new_upload(),
+                                  extra={'content_type': 'application/octet-stream', 'HTTP_UPLOAD_OFFSET': '0'})),
+    Route('upload_complete', 19, send('student', 'post', 'upload-complete', lambda d: {'pk': d.fresh.id},
+                                     setup=lambda d, i: d.new_upload(offset=10))),
+    Route('lecture_list', 5, get('student', 'lecture-list', lambda d: d.course_kwargs())),
+    Route('lecture_detail', 4, get('student', 'lecture-detail', lambda d: d.course_kwargs(pk=d.lecture.id))),
+    Route('lecture_create', 19, send('teacher', 'post', 'lecture-list', lambda d: d.course_kwargs(),
+                                    lambda d, i: {'name': f'Bench {i}', 'file': pdf_file('slides.pdf')},
+                                    format='multipart')),
+    Route('lecture_update', 8, send('teacher', 'patch', 'lecture-detail', lambda d: d.course_kwargs(pk=d.lecture.id),
+                                    lambda d, i: {'name': f'Lecture {i}'})),
+    Route('lecture_delete', 8, send('teacher', 'delete', 'lecture-detail', lambda d: d.course_kwargs(pk=d.fresh.id),
+                                    setup=lambda d, i: Lecture.objects.create(course=d.course, name=f'Old {i}',
+                                                                              file='seed/old.pdf'))),
+    Route('hometask_list', 6, get('student', 'hometask-list', lambda d: d.lecture_kwargs())),
+    Route('hometask_detail', 5, get('student', 'hometask-detail', lambda d: d.lecture_kwargs(pk=d.hometask.id))),
+    Route('hometask_create', 12, send('teacher', 'post', 'hometask-list', lambda d: d.lecture_kwargs(),
+                                     lambda d, i: {'text': f'Bench hometask {i}.', 'max_mark': 10})),
+    Route('hometask_update', 10, send('teacher', 'patch', 'hometask-detail',
+                                     lambda d: d.lecture_kwargs(pk=d.hometask.id),
+                                     lambda d, i: {'text': f'Updated hometask {i}.'})),
+    Route('hometask_delete', 9, send('teacher', 'delete', 'hometask-detail',
+                                     lambda d: d.lecture_kwargs(pk=d.fresh.id),
+                                     setup=lambda d, i: Hometask.objects.create(lecture=d.lecture, text=f'Old {i}.'))),
+    Route('homework_list', 6, get('teacher', 'homework-list', lambda d: d.hometask_kwargs())),
+    Route('homework_list_cursor', 5, send('teacher', 'get', 'homework-list', lambda d: d.hometask_kwargs(),
+                                          lambda d, i: {'pagination': 'cursor'})),
+    Route('homework_create', 18, send('student', 'post', 'homework-list', lambda d: d.hometask_kwargs(),
+                                     lambda d, i: {'file': pdf_file('work.pdf')}, format='multipart')),
+    Route('homework_detail', 5, get('student', 'homework-detail', lambda d: d.hometask_kwargs(pk=d.homework.id))),
+    Route('homework_mark', 9, send('teacher', 'patch', 'homework-mark',
+                                   lambda d: d.hometask_kwargs(pk=d.homework.id),
+                                   lambda d, i: {'mark': 1 + i % 9})),
+    Route('homework_bulk_mark', 10, send('teacher', 'post', 'homework-bulk-mark', lambda d: d.hometask_kwargs(),
+                                        lambda d, i: {'marks': [{'homework_id': d.homework.id, 'mark': 1 + i % 9}]})),
+    Route('comment_list', 6, get('student', 'comment-list', lambda d: d.homework_kwargs())),
+    Route('comment_detail', 5, get('student', 'comment-detail', lambda d: d.homework_kwargs(pk=d.comment.id))),
+    Route('comment_create', 5, send('student', 'post', 'comment-list', lambda d: d.homework_kwargs(),
+                                    lambda d, i: {'text': f'Comment {i}'})),
+    Route('comment_update', 5, send('student', 'patch', 'comment-detail', lambda d: d.homework_kwargs(pk=d.comment.id),
+                                    lambda d, i: {'text': f'Edited {i}'})),
+    Route('comment_delete', 5, send('student', 'delete', 'comment-detail', lambda d: d.homework_kwargs(pk=d.fresh.id),
+                                    setup=lambda d, i: Comment.objects.create(homework=d.homework, owner=d.student,
+                                                                              text=f'Old {i}'))),
+]
+
+
+def request(prepared):
+    client, method, url, body, format, extra = prepared
+    return getattr(client, method)(url, data=body, format=format, **extra)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+@pytest.fixture(scope='module', autouse=True)
+def write_results():
+    yield
+    path = os.environ.get('BENCHMARK_OUTPUT')
+    if path and RESULTS:
+        with open(path, 'w') as file:
+            json.dump(RESULTS, file, indent=2, sort_keys=True)
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.CHUNKED_UPLOAD_DIR = str(tmp_path / 'chunked')
+
+
+@pytest.fixture
+def no_throttling(monkeypatch):
+    monkeypatch.setattr(SimpleRateThrottle, 'THROTTLE_RATES', {
+        scope: None for scope in ('auth', 'login', 'write', 'upload', 'grading')})
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('size', SIZES)
+def test_routes(size, no_throttling, media_root, django_assert_num_queries):
+    data = Seeded(size)
+    for route in ROUTES:
+        for cache in caches.all():
+            cache.clear()
+        prepared = route.prepare(data, 0)
+        with django_assert_num_queries(route.queries) as context:
+            response = request(prepared)
+        assert response.status_code < 400, (route.name, response.status_code, getattr(response, 'data', None))
+
+        latencies = []
+        for i in range(1, ITERATIONS + 1):
+            prepared = route.prepare(data, i)
+            started = time.perf_counter()
+            request(prepared)
+            latencies.append((time.perf_counter() - started) * 1000)
+        RESULTS.setdefault(route.name, {})[str(size)] = {
+            # captured_queries is empty by now, the log is reset by the requests that followed
+            'queries': context.final_queries - context.initial_queries,
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'max_ms': round(max(latencies), 2),
+        }
+        if len(latencies) >= MIN_P99_SAMPLES:
+            RESULTS[route.name][str(size)]['p99_ms'] = round(percentile(latencies, 0.99), 2)
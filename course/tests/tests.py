@@ -1,9 +1,54 @@
+import hashlib
+import io
+import os
+import sqlite3
+import time
+from datetime import timedelta
+from smtplib import SMTPException
+
 import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
 from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from model_bakery import baker
+from model_bakery.recipe import seq
 from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from course.models import Course
+from course import gradebook
+from course.async_views import AsyncReadView
+from course.gradebook import get_gradebook
+from course.membership import CACHE_KEY as ROLES_CACHE_KEY
+from course.membership import load_course_roles
+from course.models import (Course, CourseMembership, Gradebook, Hometask,
+                           Homework, Lecture, Notification, SearchEntry,
+                           StoredBlob, UploadSession)
+from course.response_cache import get_stats
+from course.task import expire_upload_sessions
+from course.uploads import UploadError, complete_upload, part_path
+from courses_site.db_connections import (ConnectionHealthMiddleware,
+                                         check_connection)
+from courses_site.db_router import ReplicaMiddleware, ReplicaRouter
+from courses_site.metrics import MetricsMiddleware, registry
+from courses_site.throttling import GradingRateThrottle
+from users.authentication import USER_CACHE_KEY, load_user
+from users.models import OutboxEmail, UserImport
+from users.outbox import claim_emails, drain_outbox, enqueue_emails
+from users.provisioning import import_users
+from users.task import import_users_file
 
 
 @pytest.mark.django_db
@@ -40,6 +85,39 @@ class TestRefresh:
         assert response.status_code == status.HTTP_200_OK
 
 
+@pytest.mark.django_db
+class TestLogout:
+
+    def test_logout_revokes_tokens(self, api_client, user_data, test_user):
+        tokens = api_client.post(reverse('token_obtain_pair'), data=user_data, format="json").json()
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        response = api_client.post(reverse('logout'), data={"refresh_token": tokens["refresh"]}, format="json")
+        assert response.status_code == status.HTTP_205_RESET_CONTENT
+
+        assert api_client.get(reverse('course-list')).status_code == status.HTTP_401_UNAUTHORIZED
+        response = api_client.post(reverse('token_refresh'), data={"refresh": tokens["refresh"]}, format="json")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_authentication_uses_cached_user(self, authorized_user, test_user, django_assert_num_queries):
+        url = reverse('course-list')
+        authorized_user.get(url)
+        # conditional validators only, user and page come from the cache
+        with django_assert_num_queries(1):
+            authorized_user.get(url)
+        test_user.is_active = False
+        test_user.save()
+        assert authorized_user.get(url).status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_cached_user_is_evicted_after_commit(self, test_user, django_capture_on_commit_callbacks):
+        load_user(test_user.id)
+        with django_capture_on_commit_callbacks(execute=True):
+            test_user.is_active = False
+            test_user.save()
+            # a concurrent request still sees the committed row
+            cache.set(USER_CACHE_KEY.format(test_user.id), {'id': test_user.id, 'is_active': True})
+        assert not load_user(test_user.id).is_active
+
+
 @pytest.mark.django_db
 class TestCourseList:
 
@@ -58,7 +136,8 @@ class TestCourseList:
         response = authorized_user.post(self.url, data=course_data, format="json")
         assert response.status_code == status.HTTP_201_CREATED
         assert response.json().get("name") == course_data["name"]
-        assert User.objects.filter(as_teacher__name=course_data["name"]).exists()
+        assert User.objects.filter(course_memberships__course__name=course_data["name"],
+                                   course_memberships__role='teacher').exists()
 
 
 @pytest.mark.django_db
@@ -75,10 +154,857 @@ class TestCourseDetail:
         response = authorized_user.patch(url, data=update_data, format="json")
         assert response.status_code == status.HTTP_200_OK
         assert response.json().get("name") == update_data["name"]
-        assert User.objects.filter(as_teacher__name=update_data["name"]).exists()
+        assert User.objects.filter(course_memberships__course__name=update_data["name"],
+                                   course_memberships__role='teacher').exists()
 
     def test_course_delete_authorized_user(self, authorized_user, course_data, test_user, course):
         url = reverse('course-detail', kwargs={'pk': course.id})
         response = authorized_user.delete(url)
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert not Course.objects.filter(id=course.id).exists()
+
+
+@pytest.mark.django_db
+class TestCourseMembership:
+
+    def test_roles_are_cached_between_requests(self, authorized_user, course, django_assert_num_queries):
+        url = reverse('lecture-list', kwargs={'course_pk': course.id})
+        authorized_user.get(url, format="json")
+        # conditional validators, user and page come from the cache
+        with django_assert_num_queries(1):
+            response = authorized_user.get(url, format="json")
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_roles_are_invalidated_on_roster_change(self, authorized_user, test_user, course):
+        url = reverse('lecture-list', kwargs={'course_pk': course.id})
+        assert authorized_user.get(url, format="json").status_code == status.HTTP_200_OK
+        course.members.remove(test_user)
+        assert authorized_user.get(url, format="json").status_code == status.HTTP_403_FORBIDDEN
+        course.members.add(test_user, through_defaults={'role': 'student'})
+        assert authorized_user.get(url, format="json").status_code == status.HTTP_200_OK
+
+    def test_teacher_cannot_be_added_as_student(self, authorized_user, test_user, course):
+        url = reverse('add-delete-student', kwargs={'pk': course.id})
+        response = authorized_user.put(url, data={'students': [test_user.id]}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not course.students.exists()
+
+
+@pytest.mark.django_db
+class TestCourseMembers:
+
+    def test_course_list_returns_roster_counts(self, authorized_user, course):
+        students = baker.make(User, _quantity=3)
+        course.members.add(*students, through_defaults={'role': 'student'})
+        response = authorized_user.get(reverse('course-list'), format="json")
+        result = response.json().get("results")[0]
+        assert result["teacher_count"] == 1
+        assert result["student_count"] == 3
+        assert "students" not in result
+
+    def test_members_are_paginated(self, authorized_user, course):
+        students = baker.make(User, _quantity=12)
+        course.members.add(*students, through_defaults={'role': 'student'})
+        url = reverse('course-members', kwargs={'pk': course.id})
+        response = authorized_user.get(url, data={'role': 'student'}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json().get("count") == 12
+        assert len(response.json().get("results")) == 10
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+
+    def test_homework_cursor_pages(self, authorized_user, course, hometask):
+        baker.make(Homework, hometask=hometask, _quantity=15)
+        url = reverse('homework-list', kwargs={'course_pk': course.id, 'lecture_pk': hometask.lecture_id,
+                                               'hometask_pk': hometask.id})
+        first = authorized_user.get(url, data={'pagination': 'cursor'}, format="json").json()
+        assert len(first["results"]) == 10
+        assert "cursor=" in first["next"] and "pagination=cursor" in first["next"]
+
+        baker.make(Homework, hometask=hometask)
+        second = authorized_user.get(first["next"], format="json").json()
+        ids = [item["id"] for item in first["results"] + second["results"]]
+        assert len(ids) == len(set(ids)) == 15
+        assert second["next"] is None
+
+    def test_rows_with_equal_created_are_paged_by_id(self, authorized_user, course, hometask):
+        baker.make(Homework, hometask=hometask, _quantity=25)
+        # bulk marking writes the same timestamp to every marked row
+        Homework.objects.update(created=timezone.now())
+        url = reverse('homework-list', kwargs={'course_pk': course.id, 'lecture_pk': hometask.lecture_id,
+                                               'hometask_pk': hometask.id})
+        pages = [authorized_user.get(url, data={'pagination': 'cursor'}, format="json").json()]
+        while pages[-1]["next"]:
+            pages.append(authorized_user.get(pages[-1]["next"], format="json").json())
+        ids = [item["id"] for page in pages for item in page["results"]]
+        assert ids == sorted(Homework.objects.values_list('id', flat=True), reverse=True)
+        previous = authorized_user.get(pages[-1]["previous"], format="json").json()
+        assert previous["results"] == pages[-2]["results"]
+
+    def test_limit_offset_is_default(self, authorized_user, course, lecture):
+        url = reverse('lecture-list', kwargs={'course_pk': course.id})
+        assert "count" in authorized_user.get(url, format="json").json()
+
+
+@pytest.mark.django_db
+class TestNestedRoutes:
+
+    def test_mismatched_chain_is_not_found(self, authorized_user, course, hometask):
+        other_lecture = baker.make(Lecture)
+        url = reverse('hometask-detail', kwargs={'course_pk': course.id, 'lecture_pk': other_lecture.id,
+                                                 'pk': hometask.id})
+        assert authorized_user.get(url, format="json").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_hometask_created_under_resolved_lecture(self, authorized_user, course, lecture):
+        url = reverse('hometask-list', kwargs={'course_pk': course.id, 'lecture_pk': lecture.id})
+        response = authorized_user.post(url, data={'text': 'task'}, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Hometask.objects.get(id=response.json()["id"]).lecture == lecture
+
+
+@pytest.mark.django_db
+class TestBulkMark:
+
+    def test_bulk_mark_reports_item_errors(self, authorized_user, course, hometask):
+        homeworks = baker.make(Homework, hometask=hometask, _quantity=3)
+        foreign = baker.make(Homework)
+        url = reverse('homework-bulk-mark', kwargs={'course_pk': course.id, 'lecture_pk': hometask.lecture_id,
+                                                    'hometask_pk': hometask.id})
+        data = {'marks': [
+            {'homework_id': homeworks[0].id, 'mark': 7},
+            {'homework_id': homeworks[1].id, 'mark': hometask.max_mark + 1},
+            {'homework_id': foreign.id, 'mark': 5},
+        ]}
+        response = authorized_user.post(url, data=data, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["marked"] == [homeworks[0].id]
+        assert {error["homework_id"] for error in response.json()["errors"]} == {homeworks[1].id, foreign.id}
+        assert list(Homework.objects.filter(mark__isnull=False).values_list('id', 'mark')) == [(homeworks[0].id, 7)]
+
+
+@pytest.mark.django_db
+class TestRoster:
+
+    def test_roster_import_from_csv(self, authorized_user, test_user, course):
+        students = baker.make(User, email=seq('student@example.com'), _quantity=3)
+        content = "username\n{}\n{}\nunknown\n{}\n".format(students[0].username, students[1].email, test_user.username)
+        upload = SimpleUploadedFile('roster.csv', content.encode(), content_type='text/csv')
+        url = reverse('roster-import', kwargs={'pk': course.id})
+        response = authorized_user.post(url, data={'file': upload, 'role': 'student'}, format="multipart")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["affected"] == 2
+        assert response.json()["unknown"] == ["unknown"]
+        assert response.json()["conflicts"] == [test_user.username]
+        assert set(course.students.values_list('id', flat=True)) == {students[0].id, students[1].id}
+
+    def test_roster_remove(self, authorized_user, course):
+        student = baker.make(User)
+        course.members.add(student, through_defaults={'role': 'student'})
+        url = reverse('roster', kwargs={'pk': course.id})
+        response = authorized_user.delete(url, data={'users': [student.username]}, format="json")
+        assert response.json()["affected"] == 1
+        assert not course.students.exists()
+
+    def test_set_removal_updates_course_once(self, authorized_user, course):
+        students = baker.make(User, _quantity=3)
+        course.members.add(*students, through_defaults={'role': 'student'})
+        url = reverse('add-delete-student', kwargs={'pk': course.id})
+        with CaptureQueriesContext(connection) as context:
+            response = authorized_user.delete(url, data={'students': [user.id for user in students]},
+                                              format="json")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        updates = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE "course_course"')]
+        assert len(updates) == 1
+        course.refresh_from_db()
+        assert course.student_count == 0
+
+    def test_course_deletion_does_not_grow_with_roster(self):
+        counts = []
+        for size in (5, 20):
+            course = baker.make(Course)
+            course.members.add(*baker.make(User, _quantity=size), through_defaults={'role': 'student'})
+            course.refresh_from_db()
+            with CaptureQueriesContext(connection) as context:
+                course.delete()
+            counts.append(len(context.captured_queries))
+        assert counts[0] == counts[1]
+        assert not CourseMembership.objects.exists()
+
+    def test_cached_roles_are_evicted_after_commit(self, course, django_capture_on_commit_callbacks):
+        student = baker.make(User)
+        course.members.add(student, through_defaults={'role': 'student'})
+        assert load_course_roles(student.id) == {course.id: 'student'}
+        with django_capture_on_commit_callbacks(execute=True):
+            course.members.remove(student)
+            # a concurrent request still sees the committed roster
+            cache.set(ROLES_CACHE_KEY.format(student.id), {course.id: 'student'})
+        assert load_course_roles(student.id) == {}
+
+
+@pytest.mark.django_db
+class TestChunkedUpload:
+
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        settings.CHUNKED_UPLOAD_DIR = str(tmp_path / 'chunked')
+
+    def test_upload_in_chunks_with_resume(self, authorized_user, lecture):
+        content = b'0123456789' * 10
+        response = authorized_user.post(reverse('upload-list'), data={
+            'lecture': lecture.id, 'filename': 'slides.pdf', 'size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+        }, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        session_id = response.json()["id"]
+        url = reverse('upload-detail', kwargs={'pk': session_id})
+
+        response = authorized_user.put(url, data=content[:60], content_type='application/octet-stream',
+                                       HTTP_UPLOAD_OFFSET='0')
+        assert response.json()["offset"] == 60
+        response = authorized_user.put(url, data=content[60:], content_type='application/octet-stream',
+                                       HTTP_UPLOAD_OFFSET='50')
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.json()["offset"] == 60
+        authorized_user.put(url, data=content[60:], content_type='application/octet-stream',
+                            HTTP_UPLOAD_OFFSET='60')
+
+        response = authorized_user.post(reverse('upload-complete', kwargs={'pk': session_id}))
+        assert response.status_code == status.HTTP_200_OK
+        lecture.refresh_from_db()
+        assert lecture.file.read() == content
+        assert lecture.filename == 'slides.pdf'
+
+    def test_concurrent_complete_stores_file_once(self, authorized_user, lecture):
+        session_id = authorized_user.post(reverse('upload-list'), data={
+            'lecture': lecture.id, 'filename': 'slides.pdf', 'size': 10}, format="json").json()["id"]
+        authorized_user.put(reverse('upload-detail', kwargs={'pk': session_id}), data=b'0123456789',
+                            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        stale = UploadSession.objects.get(pk=session_id)
+        response = authorized_user.post(reverse('upload-complete', kwargs={'pk': session_id}))
+        assert response.status_code == status.HTTP_200_OK
+        with pytest.raises(UploadError):
+            complete_upload(stale)
+        assert StoredBlob.objects.get().refcount == 1
+
+    def test_abandoned_uploads_expire(self, settings, authorized_user, lecture):
+        settings.CHUNKED_UPLOAD_EXPIRY = 60
+        session_id = authorized_user.post(reverse('upload-list'), data={
+            'lecture': lecture.id, 'filename': 'slides.pdf', 'size': 10}, format="json").json()["id"]
+        authorized_user.put(reverse('upload-detail', kwargs={'pk': session_id}), data=b'01234',
+                            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        session = UploadSession.objects.get(pk=session_id)
+        path = part_path(session)
+        expire_upload_sessions()
+        assert os.path.exists(path)
+
+        UploadSession.objects.filter(pk=session_id).update(created=timezone.now() - timedelta(minutes=2))
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        assert expire_upload_sessions() == 1
+        assert not os.path.exists(path) and not UploadSession.objects.exists()
+
+    def test_student_cannot_upload_lecture_file(self, authorized_user, test_user, course, lecture):
+        course.members.remove(test_user)
+        course.members.add(test_user, through_defaults={'role': 'student'})
+        response = authorized_user.post(reverse('upload-list'), data={
+            'lecture': lecture.id, 'filename': 'slides.pdf', 'size': 10}, format="json")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestFileDownload:
+
+    @pytest.fixture
+    def url(self, settings, tmp_path, course, lecture):
+        settings.MEDIA_ROOT = str(tmp_path)
+        lecture.file.save('video.mp4', ContentFile(b'0123456789'))
+        return reverse('lecture-download', kwargs={'course_pk': course.id, 'pk': lecture.id})
+
+    def test_download_with_range(self, authorized_user, url):
+        response = authorized_user.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Disposition'] == "inline; filename*=UTF-8''video.mp4"
+        assert b''.join(response.streaming_content) == b'0123456789'
+
+        response = authorized_user.get(url, HTTP_RANGE='bytes=2-5')
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Range'] == 'bytes 2-5/10'
+        assert b''.join(response.streaming_content) == b'2345'
+
+    def test_repeat_download_not_modified(self, authorized_user, url):
+        etag = authorized_user.get(url)['ETag']
+        response = authorized_user.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_download_through_proxy(self, authorized_user, settings, url):
+        settings.FILE_ACCEL_REDIRECT_PREFIX = '/protected/'
+        response = authorized_user.get(url)
+        assert response['X-Accel-Redirect'].startswith('/protected/blobs/')
+        assert not response.content
+
+
+@pytest.mark.django_db
+class TestContentAddressedStorage:
+
+    @pytest.fixture(autouse=True)
+    def media_root(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+
+    def test_identical_files_share_blob(self, course, django_capture_on_commit_callbacks):
+        first = baker.make(Lecture, course=course)
+        second = baker.make(Lecture, course=course)
+        first.file.save('slides.pdf', ContentFile(b'slides'))
+        second.file.save('copy.pdf', ContentFile(b'slides'))
+        assert first.file.name == second.file.name
+        assert StoredBlob.objects.get().refcount == 2
+
+        with django_capture_on_commit_callbacks(execute=True):
+            first.delete()
+        assert second.file.storage.exists(second.file.name)
+        with django_capture_on_commit_callbacks(execute=True):
+            second.delete()
+        assert not StoredBlob.objects.exists()
+        assert not second.file.storage.exists(second.file.name)
+
+    def test_upload_session_skips_known_content(self, authorized_user, course, lecture):
+        other = baker.make(Lecture, course=course)
+        other.file.save('slides.pdf', ContentFile(b'slides'))
+        response = authorized_user.post(reverse('upload-list'), data={
+            'lecture': lecture.id, 'filename': 'slides.pdf', 'size': 6,
+            'sha256': hashlib.sha256(b'slides').hexdigest(),
+        }, format="json")
+        assert response.json()["completed"]
+        lecture.refresh_from_db()
+        assert lecture.file.name == other.file.name
+
+
+@pytest.mark.django_db
+class TestGradebook:
+
+    def test_gradebook_is_updated_incrementally(self, authorized_user, course, hometask,
+                                                django_assert_num_queries):
+        student = baker.make(User)
+        homework = baker.make(Homework, hometask=hometask, student=student)
+        url = reverse('gradebook', kwargs={'pk': course.id})
+        data = authorized_user.get(url, format="json").json()
+        assert data["marks"] == {str(student.id): {str(hometask.id): None}}
+
+        homework.mark = 8
+        homework.save()
+        # gradebook row, user comes from the cache
+        with django_assert_num_queries(1):
+            data = authorized_user.get(url, format="json").json()
+        assert data["marks"][str(student.id)][str(hometask.id)] == 8
+
+    def test_gradebook_lists_enrolled_students(self, authorized_user, course, hometask):
+        student = baker.make(User)
+        course.members.add(student, through_defaults={'role': 'student'})
+        url = reverse('gradebook', kwargs={'pk': course.id})
+        assert authorized_user.get(url, format="json").json()["marks"] == {str(student.id): {}}
+        newcomer = baker.make(User)
+        authorized_user.post(reverse('roster', kwargs={'pk': course.id}),
+                             data={'users': [newcomer.username]}, format="json")
+        assert authorized_user.get(url, format="json").json()["marks"] == {str(student.id): {},
+                                                                          str(newcomer.id): {}}
+
+    def test_gradebook_is_stored_under_lock(self, course, hometask):
+        student = baker.make(User)
+        # a writer without a snapshot leaves an empty one, so a build waits for it instead of racing
+        baker.make(Homework, hometask=hometask, student=student, mark=5)
+        assert Gradebook.objects.get(course=course).data == {}
+        assert get_gradebook(course.id)["marks"] == {str(student.id): {str(hometask.id): 5}}
+
+    def test_reader_keeps_fresher_cached_gradebook(self, course, hometask, monkeypatch):
+        fresh = {'hometasks': {}, 'marks': {'1': {}}}
+        real_store = gradebook.store_gradebook
+
+        def store_while_writer_commits(course_id):
+            data = real_store(course_id)
+            cache.set(gradebook.CACHE_KEY.format(course_id), fresh)
+            return data
+
+        monkeypatch.setattr(gradebook, 'store_gradebook', store_while_writer_commits)
+        get_gradebook(course.id)
+        assert cache.get(gradebook.CACHE_KEY.format(course.id)) == fresh
+
+    def test_gradebook_for_teachers_only(self, authorized_user, test_user, course):
+        course.members.remove(test_user)
+        course.members.add(test_user, through_defaults={'role': 'student'})
+        response = authorized_user.get(reverse('gradebook', kwargs={'pk': course.id}), format="json")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestCounters:
+
+    def test_counters_follow_changes(self, course, hometask):
+        students = baker.make(User, _quantity=2)
+        course.members.add(*students, through_defaults={'role': 'student'})
+        homework = baker.make(Homework, hometask=hometask, student=students[0])
+        baker.make(Homework, hometask=hometask, student=students[1])
+        homework.mark = 5
+        homework.save()
+        course.members.remove(students[1])
+
+        course.refresh_from_db()
+        hometask.refresh_from_db()
+        assert (course.lecture_count, course.teacher_count, course.student_count) == (1, 1, 1)
+        assert Lecture.objects.get(id=hometask.lecture_id).hometask_count == 1
+        assert (hometask.homework_count, hometask.graded_count) == (2, 1)
+
+    def test_rebuild_counters_command(self, course, hometask):
+        Course.objects.update(lecture_count=0, teacher_count=0)
+        call_command('rebuild_counters', stdout=io.StringIO())
+        course.refresh_from_db()
+        assert (course.lecture_count, course.teacher_count) == (1, 1)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise SMTPException('Service unavailable')
+
+
+@pytest.mark.django_db
+class TestEmailOutbox:
+
+    def test_registration_email_is_queued_and_sent(self, api_client, register_data):
+        api_client.post(reverse('register'), data=register_data, format='json')
+        assert OutboxEmail.objects.filter(to=register_data['email'], status=OutboxEmail.PENDING).exists()
+
+        assert drain_outbox() == 1
+        assert mail.outbox[0].to == [register_data['email']]
+        assert OutboxEmail.objects.get().status == OutboxEmail.SENT
+
+    def test_failed_email_is_retried_later(self, settings):
+        settings.EMAIL_BACKEND = 'course.tests.tests.FailingEmailBackend'
+        enqueue_emails(['first@example.com', 'second@example.com'], 'Subject', 'Body')
+        assert drain_outbox() == 0
+        email = OutboxEmail.objects.first()
+        assert (email.status, email.attempts) == (OutboxEmail.PENDING, 1)
+        assert email.next_attempt > timezone.now()
+        assert drain_outbox() == 0
+
+    def test_claimed_emails_are_skipped_until_claim_expires(self, settings):
+        enqueue_emails(['first@example.com'], 'Subject', 'Body')
+        assert len(claim_emails(10, timezone.now())) == 1
+        # another worker while the first one is sending
+        assert drain_outbox() == 0 and not mail.outbox
+        later = timezone.now() + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT + 1)
+        assert len(claim_emails(10, later)) == 1
+
+
+@pytest.mark.django_db
+class TestNotifications:
+
+    def test_lecture_publication_is_fanned_out(self, authorized_user, settings, course,
+                                               django_capture_on_commit_callbacks):
+        settings.NOTIFICATION_CHUNK_SIZE = 2
+        students = baker.make(User, email=seq('student@example.com'), _quantity=5)
+        course.members.add(*students, through_defaults={'role': 'student'})
+        with django_capture_on_commit_callbacks(execute=True):
+            lecture = baker.make(Lecture, course=course)
+
+        assert Notification.objects.filter(object_id=lecture.id, kind=Notification.LECTURE).count() == 5
+        assert OutboxEmail.objects.count() == 5
+
+        client = APIClient()
+        client.force_authenticate(students[0])
+        response = client.get(reverse('notifications'), format="json")
+        assert len(response.json()["results"]) == 1
+
+
+@pytest.mark.django_db
+class TestAsyncViews:
+
+    def test_async_lecture_list_matches_sync(self, authorized_user, course, lecture):
+        kwargs = {'course_pk': course.id}
+        sync = authorized_user.get(reverse('lecture-list', kwargs=kwargs), format="json").json()
+        response = authorized_user.get(reverse('async-lecture-list', kwargs=kwargs), format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == sync
+
+    def test_async_base_view_cannot_be_routed(self):
+        with pytest.raises(ImproperlyConfigured):
+            AsyncReadView.as_view()
+
+    def test_async_views_check_membership(self, authorized_user, course, hometask):
+        kwargs = {'course_pk': course.id, 'lecture_pk': hometask.lecture_id}
+        other = baker.make(Course)
+        assert APIClient().get(reverse('async-course-list')).status_code == status.HTTP_401_UNAUTHORIZED
+        assert authorized_user.get(reverse('async-course-detail', kwargs={'pk': other.id})).status_code == \
+            status.HTTP_403_FORBIDDEN
+        url = reverse('async-hometask-detail', kwargs={**kwargs, 'pk': hometask.id})
+        assert authorized_user.get(url).json()["id"] == hometask.id
+        url = reverse('async-hometask-detail', kwargs={**kwargs, 'lecture_pk': baker.make(Lecture).id,
+                                                       'pk': hometask.id})
+        assert authorized_user.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestConditionalGet:
+
+    def test_lecture_list_not_modified(self, authorized_user, course, lecture, django_assert_num_queries):
+        url = reverse('lecture-list', kwargs={'course_pk': course.id})
+        etag = authorized_user.get(url, format="json")['ETag']
+        # validators
+        with django_assert_num_queries(1):
+            response = authorized_user.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        baker.make(Hometask, lecture=lecture)
+        response = authorized_user.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_deletes_are_not_hidden_by_if_modified_since(self, authorized_user, course, lecture):
+        url = reverse('lecture-list', kwargs={'course_pk': course.id})
+        baker.make(Lecture, course=course)
+        response = authorized_user.get(url, format="json")
+        assert 'Last-Modified' not in response
+        lecture.delete()
+        response = authorized_user.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['count'] == 1
+
+    def test_detail_validators_follow_updates(self, authorized_user, course, lecture):
+        url = reverse('lecture-detail', kwargs={'course_pk': course.id, 'pk': lecture.id})
+        response = authorized_user.get(url, format="json")
+        authorized_user.patch(url, data={'name': 'renamed'}, format="json")
+        assert authorized_user.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestResponseCache:
+
+    def test_course_changes_evict_only_its_subtree(self, authorized_user, test_user, course, lecture):
+        other = baker.make(Course)
+        other.members.add(test_user, through_defaults={'role': 'student'})
+        url = reverse('lecture-list', kwargs={'course_pk': course.id})
+        other_url = reverse('lecture-list', kwargs={'course_pk': other.id})
+        for _ in range(2):
+            authorized_user.get(url, format="json")
+            authorized_user.get(other_url, format="json")
+        assert get_stats()['hits'] == 2
+
+        baker.make(Hometask, lecture=lecture)
+        assert authorized_user.get(url, format="json").json()["results"][0]["hometask_count"] == 1
+        authorized_user.get(other_url, format="json")
+        assert get_stats() == {'hits': 3, 'misses': 3, 'hit_ratio': 0.5}
+
+    def test_students_do_not_share_homework_pages(self, course, hometask):
+        students = baker.make(User, _quantity=2)
+        course.members.add(*students, through_defaults={'role': 'student'})
+        for student in students:
+            baker.make(Homework, hometask=hometask, student=student)
+        url = reverse('homework-list', kwargs={'course_pk': course.id, 'lecture_pk': hometask.lecture_id,
+                                               'hometask_pk': hometask.id})
+        seen = []
+        for student in students:
+            client = APIClient()
+            client.force_authenticate(student)
+            seen.append(client.get(url, format="json").json()["results"][0]["student"])
+        assert len(set(seen)) == 2
+
+
+@pytest.mark.django_db
+class TestThrottling:
+
+    def test_login_attempts_are_limited_per_username(self, api_client, test_user):
+        url = reverse('token_obtain_pair')
+        data = {'username': test_user.username, 'password': 'wrong'}
+        for _ in range(5):
+            assert api_client.post(url, data=data, format="json").status_code == status.HTTP_401_UNAUTHORIZED
+        response = api_client.post(url, data=data, format="json")
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert 1 <= int(response['Retry-After']) <= 60
+        other = {'username': 'someone-else', 'password': 'wrong'}
+        assert api_client.post(url, data=other, format="json").status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_previous_window_is_weighted(self, monkeypatch):
+        throttle = GradingRateThrottle()
+        request = type('Request', (), {'user': baker.make(User), 'method': 'POST'})()
+        now = [600.0]
+        monkeypatch.setattr(throttle, 'timer', lambda: now[0])
+        assert all(throttle.allow_request(request, None) for _ in range(60))
+        assert not throttle.allow_request(request, None)
+        # halfway through the next window half of the previous one still counts
+        now[0] = 690.0
+        assert sum(throttle.allow_request(request, None) for _ in range(60)) == 30
+
+
+@pytest.mark.django_db
+class TestImportUsers:
+
+    csv = (b'username,email,password,first_name,last_name\n'
+           b'alice,alice@example.com,Str0ng-pass-1,Alice,A\n'
+           b'bob,bob@example.com,Str0ng-pass-2,Bob,B\n'
+           b'username,taken@example.com,Str0ng-pass-3,,\n'
+           b'bad name!,,Str0ng-pass-4,,\n'
+           b'alice,alice2@example.com,Str0ng-pass-5,,\n')
+
+    def test_command_hashes_in_pool_and_enrolls(self, tmp_path, test_user, course):
+        path = tmp_path / 'users.csv'
+        path.write_bytes(self.csv)
+        call_command('import_users', str(path), course=course.id, workers=2, stdout=io.StringIO())
+
+        alice = User.objects.get(username='alice')
+        assert alice.check_password('Str0ng-pass-1')
+        assert set(course.students.values_list('username', flat=True)) == {'alice', 'bob'}
+        assert OutboxEmail.objects.filter(to__in=['alice@example.com', 'bob@example.com']).count() == 2
+
+    def test_api_reports_rejected_rows(self, api_client, django_capture_on_commit_callbacks):
+        api_client.force_authenticate(baker.make(User, is_staff=True))
+        baker.make(User, username='username')
+        file = SimpleUploadedFile('users.csv', self.csv, content_type='text/csv')
+        with django_capture_on_commit_callbacks(execute=True):
+            response = api_client.post(reverse('import-users'), data={'file': file, 'send_welcome': False},
+                                       format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        result = api_client.get(response['Location']).json()
+        assert result['status'] == 'done'
+        report = result['report']
+        assert report['created'] == 2
+        assert [item['line'] for item in report['duplicates']] == [4, 6]
+        assert [item['line'] for item in report['invalid']] == [5]
+        assert not OutboxEmail.objects.exists()
+        assert not bytes(UserImport.objects.get().content)
+
+    def test_failed_import_is_reported(self, api_client, monkeypatch):
+        api_client.force_authenticate(baker.make(User, is_staff=True))
+
+        def broken_import(*args, **kwargs):
+            raise ValueError('broken csv')
+
+        monkeypatch.setattr('users.task.import_users', broken_import)
+        user_import = UserImport.objects.create(content=self.csv)
+        with pytest.raises(ValueError):
+            import_users_file(str(user_import.pk), None, 'student', False)
+        result = api_client.get(reverse('import-users-status', kwargs={'import_id': user_import.pk})).json()
+        assert result['status'] == 'failed'
+        assert 'broken csv' in result['error']
+
+    def test_created_users_are_enrolled_by_id(self, course):
+        other = baker.make(User, username='frank', email='grace')
+        rows = [(2, {'username': 'grace', 'email': '', 'password': '', 'first_name': '', 'last_name': ''})]
+        assert import_users(rows, course=course, send_welcome=False).enrolled == 1
+        assert set(course.students.values_list('username', flat=True)) == {'grace'}
+        assert not course.students.filter(pk=other.pk).exists()
+
+    def test_rows_without_email_are_not_duplicates(self):
+        baker.make(User, username='dave', email='')
+        rows = [(2, {'username': 'carol', 'email': '', 'password': '', 'first_name': '', 'last_name': ''})]
+        report = import_users(rows, send_welcome=False)
+        assert report.created == 1 and report.duplicate_count == 0
+
+    def test_created_counts_inserted_rows_only(self, monkeypatch):
+        rows = [(2, {'username': 'erin', 'email': '', 'password': '', 'first_name': '', 'last_name': ''})]
+        real_bulk_create = User.objects.bulk_create
+
+        def bulk_create_after_concurrent_insert(users, **kwargs):
+            baker.make(User, username='erin')
+            return real_bulk_create(users, **kwargs)
+
+        monkeypatch.setattr(User.objects, 'bulk_create', bulk_create_after_concurrent_insert)
+        assert import_users(rows, send_welcome=False).created == 0
+
+
+@pytest.mark.django_db
+class TestMetrics:
+
+    def test_route_metrics_are_exported(self, authorized_user, course, lecture):
+        registry.reset()
+        authorized_user.get(reverse('lecture-list', kwargs={'course_pk': course.id}), format="json")
+        admin = APIClient()
+        admin.force_authenticate(baker.make(User, is_staff=True))
+        response = admin.get(reverse('metrics'))
+        assert response.status_code == status.HTTP_200_OK
+        text = response.content.decode()
+        assert 'http_requests_total{route="lecture-list",method="GET",status="200"} 1' in text
+        assert 'serializer_duration_seconds_count{route="lecture-list"} 1' in text
+        queries = next(line for line in text.splitlines()
+                       if line.startswith('db_queries_per_request_sum{route="lecture-list"}'))
+        assert float(queries.split()[-1]) > 0
+
+    def test_metrics_are_admin_only(self, authorized_user):
+        assert authorized_user.get(reverse('metrics')).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_middleware_runs_async(self, rf):
+        registry.reset()
+
+        async def view(request):
+            return HttpResponse(status=201)
+
+        middleware = MetricsMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        assert async_to_sync(middleware)(rf.post('/')).status_code == status.HTTP_201_CREATED
+        assert registry.snapshot()['routes']['unmatched']['requests'] == {('POST', 201): 1}
+
+
+@pytest.mark.django_db
+class TestSearch:
+
+    def test_search_is_ranked_and_scoped_to_memberships(self, authorized_user, course, lecture):
+        lecture.name = 'Recursion'
+        lecture.save()
+        baker.make(Hometask, lecture=lecture, text='Write a recursive parser.')
+        baker.make(Hometask, lecture=baker.make(Lecture), text='Recursion outside of the course.')
+        response = authorized_user.get(reverse('search'), {'q': 'recursion'})
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()['results']
+        assert [(item['kind'], item['course']) for item in results] == \
+            [(SearchEntry.LECTURE, course.id), (SearchEntry.HOMETASK, course.id)]
+        assert results[0]['rank'] > results[1]['rank']
+        response = authorized_user.get(reverse('search'), {'q': 'recursion', 'kind': 'hometask'})
+        assert response.json()['count'] == 1
+
+    def test_entries_follow_changes(self, authorized_user, course, hometask):
+        hometask.text = 'Implement quicksort.'
+        hometask.save()
+        assert authorized_user.get(reverse('search'), {'q': 'quicksort'}).json()['count'] == 1
+        hometask.delete()
+        assert authorized_user.get(reverse('search'), {'q': 'quicksort'}).json()['count'] == 0
+        assert authorized_user.get(reverse('search'), {'q': '"*'}).json()['count'] == 0
+        assert authorized_user.get(reverse('search')).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_other_databases_fall_back_to_icontains(self, authorized_user, course, hometask, monkeypatch):
+        hometask.text = 'Implement quicksort in place.'
+        hometask.save()
+        monkeypatch.setattr(connection, 'vendor', 'mysql')
+        response = authorized_user.get(reverse('search'), {'q': 'QuickSort place'})
+        assert [item['kind'] for item in response.json()['results']] == [SearchEntry.HOMETASK]
+        assert authorized_user.get(reverse('search'), {'q': 'quicksort heap'}).json()['count'] == 0
+
+    def test_rebuild_indexes_bulk_created_rows(self, authorized_user, course):
+        Lecture.objects.bulk_create([Lecture(course=course, name='Graphs', file='graphs.pdf')])
+        assert authorized_user.get(reverse('search'), {'q': 'graph'}).json()['count'] == 0
+        call_command('rebuild_search_index')
+        assert authorized_user.get(reverse('search'), {'q': 'graph'}).json()['count'] == 1
+
+
+@pytest.fixture
+def replica(settings, tmp_path):
+    """
+    Replica in its own SQLite file that never catches up: a copy of the primary taken by the fixture.
+    """
+    path = str(tmp_path / 'replica.sqlite3')
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    connection.connection.backup(target)
+    target.close()
+    connections.databases['replica_1'] = connections.configure_settings(
+        {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}})['default']
+    settings.DATABASE_REPLICAS = ['replica_1']
+    yield connections['replica_1']
+    connections['replica_1'].close()
+    del connections['replica_1']
+    del connections.databases['replica_1']
+
+
+class TestReplicaRouter:
+
+    @pytest.mark.django_db(transaction=True)
+    def test_read_after_write_sees_the_write(self, authorized_user, course, lecture, replica):
+        # written after the replica was taken
+        student = baker.make(User)
+        other = baker.make(User)
+        course.members.add(other, through_defaults={'role': 'teacher'})
+        fresh = baker.make(Lecture, course=course)
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other).access_token}')
+        members = reverse('course-members', kwargs={'pk': course.id})
+
+        with CaptureQueriesContext(replica) as replica_reads:
+            response = authorized_user.put(reverse('add-delete-student', kwargs={'pk': course.id}),
+                                           data={'students': [student.id]}, format="json")
+            assert response.status_code == status.HTTP_200_OK
+            # the writer is pinned to the primary
+            assert student.id in [item['id'] for item in authorized_user.get(members).json()['results']]
+            assert not replica_reads.captured_queries
+            # other clients read the replica, which has not seen the write
+            assert student.id not in [item['id'] for item in other_client.get(members).json()['results']]
+            assert replica_reads.captured_queries
+            # cached responses and roles are filled from the primary
+            response = other_client.get(reverse('lecture-list', kwargs={'course_pk': course.id}))
+            assert {item['id'] for item in response.json()['results']} == {lecture.id, fresh.id}
+
+        url = reverse('lecture-detail', kwargs={'course_pk': course.id, 'pk': lecture.id})
+        assert other_client.patch(url, data={'name': 'Replication'}, format="json").status_code == status.HTTP_200_OK
+        response = other_client.get(reverse('lecture-list', kwargs={'course_pk': course.id}))
+        assert 'Replication' in [item['name'] for item in response.json()['results']]
+        assert not ReplicaRouter().allow_migrate('replica_1', 'course')
+
+    def test_async_writer_is_pinned_to_primary(self, settings, rf):
+        settings.DATABASE_REPLICAS = ['replica_1']
+        router = ReplicaRouter()
+        reads = []
+
+        async def view(request):
+            if request.method == 'POST':
+                router.db_for_write(Lecture)
+                return HttpResponse(status=201)
+            reads.append(router.db_for_read(Lecture))
+            return HttpResponse()
+
+        middleware = async_to_sync(ReplicaMiddleware(view))
+        middleware(rf.get('/', REMOTE_ADDR='10.0.0.3'))
+        middleware(rf.post('/', REMOTE_ADDR='10.0.0.3'))
+        middleware(rf.get('/', REMOTE_ADDR='10.0.0.3'))
+        assert reads == ['replica_1', None]
+
+
+class TestConnectionHealth:
+
+    class Connection:
+        alias = 'default'
+        in_atomic_block = False
+
+        def __init__(self, usable, last_used):
+            self.connection = object()
+            self.usable = usable
+            self.last_used = last_used
+
+        def is_usable(self):
+            return self.usable
+
+        def close(self):
+            self.connection = None
+
+    def test_idle_connection_is_pinged(self, settings):
+        settings.DB_CONN_HEALTH_CHECK_INTERVAL = 10
+        registry.reset()
+        fresh = self.Connection(usable=False, last_used=95)
+        assert check_connection(fresh, now=100) and fresh.connection
+        stale = self.Connection(usable=False, last_used=80)
+        assert not check_connection(stale, now=100) and stale.connection is None
+        alive = self.Connection(usable=True, last_used=80)
+        assert check_connection(alive, now=100)
+        assert registry.snapshot()['counters'] == {('db_connections_unusable_total', 'default'): 1}
+
+    @pytest.mark.django_db
+    def test_connection_counters_are_exported(self, authorized_user):
+        registry.reset()
+        authorized_user.get(reverse('course-list'))
+        admin = APIClient()
+        admin.force_authenticate(baker.make(User, is_staff=True))
+        text = admin.get(reverse('metrics')).content.decode()
+        assert '# TYPE db_connections_reused_total counter' in text
+        assert 'db_connections_reused_total{alias="default"}' in text
+
+    @pytest.mark.django_db
+    def test_async_middleware_checks_connections_of_sync_thread(self, rf):
+        registry.reset()
+        connection.ensure_connection()
+        connection.last_used = 0
+
+        async def view(request):
+            return HttpResponse()
+
+        middleware = ConnectionHealthMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        async_to_sync(middleware)(rf.get('/'))
+        assert registry.snapshot()['counters'][('db_connections_reused_total', 'default')] == 1
+        assert connection.last_used > 0
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+from .storage import HashingFile
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+
+    def __init__(self, offset):
+        super().__init__(f"Upload offset must be {offset}.")
+        self.offset = offset
+
+
+def part_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.id}.part')
+
+
+def lock_session(session):
+    """
+    Lock the session row until the transaction ends and refresh its progress from it.
+    """
+    locked = UploadSession.objects.select_for_update().only('offset', 'completed').get(pk=session.pk)
+    session.offset, session.completed = locked.offset, locked.completed
+    if session.completed:
+        raise UploadError("Upload is already completed.")
+    return session
+
+
+def append_chunk(session, stream, offset):
+    """
+    Append request body to partial file at the offset. Bytes after the last acknowledged
+    offset (left by an interrupted request) are dropped, so the client can resume from `offset`.
+
+    The body is spooled to a temporary file first, the session row is locked only for the offset
+    check and the local copy, not while a slow client is sending.
+    """
+    if session.completed:
+        raise UploadError("Upload is already completed.")
+    if offset != session.offset:
+        raise OffsetMismatch(session.offset)
+
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    with tempfile.TemporaryFile(dir=settings.CHUNKED_UPLOAD_DIR) as chunk:
+        length = 0
+        while block := stream.read(BLOCK_SIZE):
+            length += len(block)
+            if offset + length > session.size:
+                raise UploadError("Chunk exceeds declared file size.")
+            chunk.write(block)
+        chunk.seek(0)
+
+        with transaction.atomic():
+            # requests of the same session wait here, so only one writes at the acknowledged offset
+            lock_session(session)
+            if offset != session.offset:
+                raise OffsetMismatch(session.offset)
+            with os.fdopen(os.open(part_path(session), os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as part:
+                part.truncate(offset)
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, BLOCK_SIZE)
+            UploadSession.objects.filter(pk=session.pk).update(offset=offset + length, created=timezone.now())
+            session.offset = offset + length
+    return session
+
+
+def expire_uploads():
+    """
+    Delete incomplete sessions untouched for CHUNKED_UPLOAD_EXPIRY seconds and partial files left
+    by them or by sessions deleted with their lecture/homework. Return number of removed files.
+    """
+    expiry = settings.CHUNKED_UPLOAD_EXPIRY
+    UploadSession.objects.filter(completed=False, created__lt=timezone.now() - timedelta(seconds=expiry)).delete()
+    if not os.path.isdir(settings.CHUNKED_UPLOAD_DIR):
+        return 0
+    removed = 0
+    deadline = time.time() - expiry
+    with os.scandir(settings.CHUNKED_UPLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith('.part') and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+
+def complete_upload(session):
+    """
+    Move finished partial file to storage and attach it to the lecture/homework.
+    The session row stays locked until it is attached, a concurrent complete fails without storing
+    the file again.
+    """
+    if session.completed:
+        raise UploadError("Upload is already completed.")
+
+    path = part_path(session)
+    with transaction.atomic():
+        lock_session(session)
+        if session.offset != session.size:
+            raise UploadError(f"Upload is incomplete: {session.offset} of {session.size} bytes received.")
+
+        target = session.target
+        storage = target.file.storage
+        with open(path, 'rb') as part:
+            content = HashingFile(part, session.filename)
+            name = storage.save(target.file.field.generate_filename(target, session.filename), content)
+        digest = content.sha256.hexdigest()
+        if session.sha256 and session.sha256 != digest:
+            # committed with the stored reference, so the blob is released and not just rolled back
+            storage.delete(name)
+        else:
+            session.sha256 = digest
+            attach(session, name)
+    if not session.completed:
+        raise UploadError("Checksum mismatch.")
+    os.remove(path)
+    return session
+
+
+def reuse_stored_file(session):
+    """
+    Attach already stored file with the declared sha256, so the client does not send the bytes.
+    """
+    storage = session.target.file.storage
+    if not session.sha256 or not hasattr(storage, 'reuse'):
+        return False
+    name = storage.reuse(session.sha256, session.filename, session.size)
+    if name is None:
+        return False
+    session.offset = session.size
+    attach(session, name)
+    return True
+
+
+def attach(session, name):
+    target = session.target
+    with transaction.atomic():
+        target.file.name = name
+        target.filename = session.filename
+        target.save()
+        session.completed = True
+        session.save(update_fields=['offset', 'sha256', 'completed', 'created'])
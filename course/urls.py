@@ -2,7 +2,10 @@ from django.urls import include, path
 from rest_framework_nested.routers import NestedSimpleRouter, SimpleRouter
 
 from .views import (AddDeleteStudentView, AddTeacherView, CommentView,
-                    CourseView, HometaskView, HomeworkView, LectureView)
+                    CourseMemberView, CourseView, GradebookView, HometaskView,
+                    HomeworkView, LectureView, NotificationView,
+                    ResponseCacheStatsView, RosterImportView, RosterView,
+                    SearchView, UploadSessionView)
 
 course_router = SimpleRouter()
 course_router.register(r'', CourseView, basename='course')
@@ -15,10 +18,21 @@ homework_router.register(r'homework', HomeworkView, basename='homework')
 comment_router = NestedSimpleRouter(homework_router, r'homework', lookup='homework')
 comment_router.register(r'comment', CommentView, basename='comment')
 
+upload_router = SimpleRouter()
+upload_router.register(r'uploads', UploadSessionView, basename='upload')
+
 
 urlpatterns = [
+    path('notifications/', NotificationView.as_view(), name='notifications'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('cache-stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+    path('<int:pk>/members/', CourseMemberView.as_view(), name='course-members'),
+    path('<int:pk>/gradebook/', GradebookView.as_view(), name='gradebook'),
     path('<int:pk>/teachers/', AddTeacherView.as_view(), name='add-teacher'),
     path('<int:pk>/students/', AddDeleteStudentView.as_view(), name='add-delete-student'),
+    path('<int:pk>/roster/', RosterView.as_view(), name='roster'),
+    path('<int:pk>/roster/import/', RosterImportView.as_view(), name='roster-import'),
+    path('', include(upload_router.urls)),
     path('', include(course_router.urls)),
     path('', include(lecture_router.urls)),
     path('', include(hometask_router.urls)),
@@ -1,26 +1,46 @@
+import io
+
 from django.db.models import F
-from rest_framework import generics, status, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from courses_site.throttling import GradingRateThrottle, UploadRateThrottle
 
-from .models import Comment, Course, Hometask, Homework, Lecture
+from .conditional import ConditionalGetMixin
+from .files import PassthroughRenderer, serve_file
+from .gradebook import get_gradebook
+from .membership import STUDENT, get_course_role, get_course_roles
+from .models import (Comment, Course, CourseMembership, Hometask, Homework,
+                     Lecture, Notification, UploadSession)
+from .pagination import CreatedCursorPagination, OptionalCursorPagination
 from .permissions import (IsOwnerOfComment, StudentPermissions,
                           TeacherPermissions)
+from .resolvers import NestedRouteMixin
+from .response_cache import CachedResponseMixin, get_stats
+from .roster import enroll, iter_csv_identifiers, remove_members, unenroll
+from .search import search
 from .serializers import (AddDeleteStudentSerializer, AddTeacherSerializer,
-                          CommentSerializer, CourseSerializer,
+                          BulkMarkSerializer, CommentSerializer,
+                          CourseMemberSerializer, CourseSerializer,
                           HometaskSerializer, HomeworkSerializer,
-                          LectureSerializer, MarkSerializer)
+                          LectureSerializer, MarkSerializer,
+                          NotificationSerializer, RosterImportSerializer,
+                          RosterSerializer, SearchQuerySerializer,
+                          SearchResultSerializer, UploadSessionSerializer)
+from .uploads import OffsetMismatch, UploadError, append_chunk, complete_upload
 
 
-class CourseView(viewsets.ModelViewSet):
+class CourseView(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     serializer_class = CourseSerializer
+    conditional_counters = ('lecture_count', 'teacher_count', 'student_count')
 
     def get_queryset(self):
-        teacher_courses = self.request.user.as_teacher.all()
-        student_courses = self.request.user.as_student.all()
-        queryset = teacher_courses | student_courses
-        return queryset.distinct()
+        return Course.objects.filter(memberships__user=self.request.user)
 
     def get_permissions(self):
         if self.action in ['create', 'list']:
@@ -32,6 +52,67 @@ class CourseView(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
+class CourseMemberView(generics.ListAPIView):
+    serializer_class = CourseMemberSerializer
+    permission_classes = [IsAuthenticated, TeacherPermissions | StudentPermissions]
+
+    def get_queryset(self):
+        queryset = CourseMembership.objects.filter(course=self.kwargs['pk'])
+        role = self.request.query_params.get('role')
+        if role:
+            queryset = queryset.filter(role=role)
+        return queryset.select_related('user').order_by('role', 'user')
+
+
+class GradebookView(APIView):
+    """
+    Marks of course students for every hometask: {"hometasks": {...}, "marks": {student: {hometask: mark}}}.
+    """
+    permission_classes = [IsAuthenticated, TeacherPermissions]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_gradebook(kwargs['pk']))
+
+
+class ResponseCacheStatsView(APIView):
+    """
+    Hit and miss counters of the course response cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class NotificationView(generics.ListAPIView):
+    """
+    Notifications of the user about published lectures and hometasks, newest first.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CreatedCursorPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get('unread'):
+            queryset = queryset.filter(read=False)
+        return queryset
+
+
+class SearchView(generics.ListAPIView):
+    """
+    Ranked full-text search over courses, lectures and hometasks of the user's courses: `?q=words&kind=lecture`.
+    """
+    serializer_class = SearchResultSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        params = SearchQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return search(params.validated_data['q'], list(get_course_roles(self.request)),
+                      params.validated_data.get('kind'))
+
+
 class AddTeacherView(generics.RetrieveUpdateAPIView):
     serializer_class = AddTeacherSerializer
     permission_classes = [IsAuthenticated, TeacherPermissions]
@@ -48,8 +129,7 @@ class AddDeleteStudentView(generics.RetrieveUpdateDestroyAPIView):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
         if serializer.is_valid():
-            for student in serializer.validated_data['students']:
-                instance.students.remove(student.id)
+            remove_members(instance, [user.id for user in serializer.validated_data['students']], STUDENT)
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -58,25 +138,77 @@ class AddDeleteStudentView(generics.RetrieveUpdateDestroyAPIView):
         return Course.objects.filter(id=self.kwargs['pk'])
 
 
-class LectureView(viewsets.ModelViewSet):
+class RosterView(generics.GenericAPIView):
+    """
+    Add (POST) or remove (DELETE) many users by username or email.
+    """
+    serializer_class = RosterSerializer
+    permission_classes = [IsAuthenticated, TeacherPermissions]
+
+    def get_queryset(self):
+        return Course.objects.filter(id=self.kwargs['pk'])
+
+    def post(self, request, *args, **kwargs):
+        return self.change_roster(enroll)
+
+    def delete(self, request, *args, **kwargs):
+        return self.change_roster(unenroll)
+
+    def change_roster(self, change):
+        instance = self.get_object()
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        report = change(instance, serializer.validated_data['users'], serializer.validated_data['role'])
+        return Response(report.as_dict())
+
+
+class RosterImportView(generics.GenericAPIView):
+    """
+    Add users listed in csv file (username or email per line).
+    """
+    serializer_class = RosterImportSerializer
+    permission_classes = [IsAuthenticated, TeacherPermissions]
+    parser_classes = [MultiPartParser]
+
+    def get_queryset(self):
+        return Course.objects.filter(id=self.kwargs['pk'])
+
+    def post(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        identifiers = iter_csv_identifiers(serializer.validated_data['file'])
+        report = enroll(instance, identifiers, serializer.validated_data['role'])
+        return Response(report.as_dict())
+
+
+class LectureView(ConditionalGetMixin, CachedResponseMixin, NestedRouteMixin, viewsets.ModelViewSet):
+    pagination_class = OptionalCursorPagination
     serializer_class = LectureSerializer
+    conditional_counters = ('hometask_count',)
 
     def get_queryset(self):
-        return Lecture.objects.filter(course=self.kwargs['course_pk'])
+        return Lecture.objects.filter(course=self.kwargs['course_pk']).select_related('course')
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'download']:
             self.permission_classes = [IsAuthenticated, TeacherPermissions | StudentPermissions]
         else:
             self.permission_classes = [IsAuthenticated, TeacherPermissions]
         return super().get_permissions()
 
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def download(self, request, **kwargs):
+        return serve_file(request, self.get_object().file)
+
 
-class HometaskView(viewsets.ModelViewSet):
+class HometaskView(ConditionalGetMixin, CachedResponseMixin, NestedRouteMixin, viewsets.ModelViewSet):
+    pagination_class = OptionalCursorPagination
     serializer_class = HometaskSerializer
+    conditional_counters = ('homework_count', 'graded_count')
 
     def get_queryset(self):
-        return Hometask.objects.filter(lecture=self.kwargs['lecture_pk'])
+        return Hometask.objects.filter(lecture=self.kwargs['lecture_pk']).select_related('lecture')
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -86,36 +218,51 @@ class HometaskView(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class HomeworkView(viewsets.ModelViewSet):
+class HomeworkView(ConditionalGetMixin, CachedResponseMixin, NestedRouteMixin, viewsets.ModelViewSet):
+    pagination_class = OptionalCursorPagination
     serializer_class = HomeworkSerializer
+    cache_per_student = True
 
     def get_queryset(self):
         course_id = self.kwargs['course_pk']
         user = self.request.user
-        if user.as_student.filter(id=course_id).exists():
-            return Homework.objects.filter(hometask=self.kwargs['hometask_pk'], student=user)
-        return Homework.objects.filter(hometask=self.kwargs['hometask_pk'])\
-            .order_by(F('created').desc(nulls_first=True))
+        queryset = Homework.objects.filter(hometask=self.kwargs['hometask_pk']).select_related('hometask', 'student')
+        if get_course_role(self.request, course_id) == STUDENT:
+            return queryset.filter(student=user)
+        return queryset.order_by(F('created').desc(nulls_first=True))
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'download']:
             self.permission_classes = [IsAuthenticated, TeacherPermissions | StudentPermissions]
-        elif self.action == 'mark':
+        elif self.action in ['mark', 'bulk_mark']:
             self.permission_classes = [IsAuthenticated, TeacherPermissions]
         else:
             self.permission_classes = [IsAuthenticated, StudentPermissions]
         return super().get_permissions()
 
-    @action(detail=True, methods=['put', 'patch'], serializer_class=MarkSerializer)
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def download(self, request, **kwargs):
+        return serve_file(request, self.get_object().file)
+
+    @action(detail=True, methods=['put', 'patch'], serializer_class=MarkSerializer,
+            throttle_classes=[GradingRateThrottle])
     def mark(self, request, pk, **kwargs):
         return super().update(request, pk, **kwargs)
 
+    @action(detail=False, methods=['post'], url_path='mark', url_name='bulk-mark',
+            serializer_class=BulkMarkSerializer, throttle_classes=[GradingRateThrottle])
+    def bulk_mark(self, request, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save())
+
 
-class CommentView(viewsets.ModelViewSet):
+class CommentView(ConditionalGetMixin, CachedResponseMixin, NestedRouteMixin, viewsets.ModelViewSet):
+    pagination_class = OptionalCursorPagination
     serializer_class = CommentSerializer
 
     def get_queryset(self):
-        return Comment.objects.filter(homework=self.kwargs['homework_pk'])
+        return Comment.objects.filter(homework=self.kwargs['homework_pk']).select_related('homework', 'owner')
 
     def get_permissions(self):
         if self.action in ['create', 'list', 'retrieve']:
@@ -123,3 +270,39 @@ class CommentView(viewsets.ModelViewSet):
         else:
             self.permission_classes = [IsAuthenticated, IsOwnerOfComment]
         return super().get_permissions()
+
+
+class UploadSessionView(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Chunked upload: create session, PUT chunks as raw body with `Upload-Offset` header, then complete.
+    Retrieve returns current offset to resume interrupted upload from.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UploadRateThrottle]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({"detail": "Upload-Offset header is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            append_chunk(session, request.stream or io.BytesIO(), offset)
+        except OffsetMismatch as e:
+            return Response({"detail": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        try:
+            complete_upload(session)
+        except UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(session).data)
@@ -1,11 +1,25 @@
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'courses_site.settings')
 app = Celery('courses_site')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+# tasks of the project apps live in task.py
+app.autodiscover_tasks(related_name='task')
+
+
+@task_prerun.connect
+@task_postrun.connect
+def manage_task_connections(task=None, **kwargs):
+    # eager tasks run inside the caller's request or transaction, which owns the connections
+    if task is not None and task.request.is_eager:
+        return
+    # imported here, the app module is loaded before django settings are configured
+    from .db_connections import close_task_connections
+    close_task_connections()
 
 
 @app.task(bind=True)
@@ -0,0 +1,86 @@
+"""
+Persistent database connections: a health check before requests reuse them, cleanup between celery
+tasks and connection counters for the metrics endpoint.
+
+Django 4.0 has no CONN_HEALTH_CHECKS, so ConnectionHealthMiddleware pings a reused connection when it
+was idle longer than DB_CONN_HEALTH_CHECK_INTERVAL and drops it if the server went away, instead of
+failing the first query of the request.
+"""
+import time
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .metrics import registry
+
+
+def check_connection(connection, now):
+    """
+    Close the open connection if it has been idle too long to trust and does not answer.
+    Return True if the open connection is kept for reuse.
+    """
+    if connection.connection is None:
+        return False
+    if connection.in_atomic_block:
+        # only in tests, the surrounding transaction owns the connection
+        return True
+    idle = now - getattr(connection, 'last_used', now)
+    if settings.DB_CONN_HEALTH_CHECKS and idle >= settings.DB_CONN_HEALTH_CHECK_INTERVAL \
+            and not connection.is_usable():
+        registry.count('db_connections_unusable_total', connection.alias)
+        connection.close()
+        return False
+    return True
+
+
+def check_connections():
+    now = time.monotonic()
+    for connection in connections.all():
+        if check_connection(connection, now):
+            registry.count('db_connections_reused_total', connection.alias)
+
+
+def mark_connections_used():
+    now = time.monotonic()
+    for connection in connections.all():
+        connection.last_used = now
+
+
+class ConnectionHealthMiddleware:
+    """
+    Under ASGI the checks run through sync_to_async, on the thread whose connections the sync views use.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        check_connections()
+        try:
+            return self.get_response(request)
+        finally:
+            mark_connections_used()
+
+    async def __acall__(self, request):
+        await sync_to_async(check_connections)()
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(mark_connections_used)()
+
+
+def close_task_connections():
+    """
+    Drop connections past CONN_MAX_AGE or broken by a celery task, like Django does around
+    requests, and publish the metrics of the worker.
+    """
+    close_old_connections()
+    registry.flush()
@@ -0,0 +1,128 @@
+"""
+Read replicas for API reads with read-your-writes.
+
+ReplicaMiddleware lets safe-method requests read from a replica. A request that writes is served
+from the primary and pins its client (user from the JWT, address for anonymous requests) to the
+primary for DATABASE_REPLICA_PIN_SECONDS, so the client sees its own changes despite replication
+lag. Outside requests (celery, management commands) everything goes to the primary.
+
+Reads whose results are cached for longer than the pin (roles, cached responses, gradebooks) run in
+primary_reads() or with .using(DEFAULT_DB_ALIAS), a stale replica read would outlive the pin there.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from users.authentication import CachedJWTAuthentication
+
+PIN_KEY = 'db-pin:{}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+force_primary = ContextVar('force_primary', default=False)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send reads of the block to the primary, e.g. when their result is stored in a cache.
+    """
+    token = force_primary.set(True)
+    try:
+        yield
+    finally:
+        force_primary.reset(token)
+
+
+def get_client_ident(request):
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if raw_token:
+        try:
+            token = authentication.get_validated_token(raw_token)
+            return f'user:{token.get(api_settings.USER_ID_CLAIM)}'
+        except (InvalidToken, TokenError):
+            pass
+    return f'addr:{request.META.get("REMOTE_ADDR")}'
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        cache = caches[settings.DATABASE_REPLICA_PIN_CACHE_ALIAS]
+        ident = get_client_ident(request)
+        safe = request.method in SAFE_METHODS
+        token = read_from_replica.set(safe and cache.get(PIN_KEY.format(ident)) is None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        if not safe and response.status_code < 400:
+            cache.set(PIN_KEY.format(ident), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        cache = caches[settings.DATABASE_REPLICA_PIN_CACHE_ALIAS]
+        ident = get_client_ident(request)
+        safe = request.method in SAFE_METHODS
+        token = read_from_replica.set(safe and await cache.aget(PIN_KEY.format(ident)) is None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        if not safe and response.status_code < 400:
+            await cache.aset(PIN_KEY.format(ident), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
+
+
+class ReplicaRouter:
+    """
+    Reads of models in DATABASE_REPLICA_APPS go to a random replica while the request allows it,
+    the first write of a request switches the rest of it to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not read_from_replica.get() or force_primary.get() \
+                or model._meta.app_label not in settings.DATABASE_REPLICA_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # reads inside a transaction must see its own writes
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        read_from_replica.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get the schema from the primary by replication
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,283 @@
+"""
+Per-route request metrics in Prometheus text format.
+
+MetricsMiddleware records, per resolved url name, request count by method and status, and histograms of
+total latency, SQL query count, SQL time and serializer time. SQL is measured by an execute wrapper
+installed on every new database connection, serialization by TimedRepresentationMixin on serializers.
+
+Each process aggregates in memory and periodically stores a snapshot in the cache, the metrics endpoint
+sums snapshots of all live processes.
+"""
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.cache import caches
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Total request latency.', SECONDS_BUCKETS),
+    'db_queries_per_request': ('SQL queries issued by one request.', QUERY_BUCKETS),
+    'db_query_duration_seconds': ('Time spent in SQL by one request.', SECONDS_BUCKETS),
+    'serializer_duration_seconds': ('Time spent serializing the response of one request.', SECONDS_BUCKETS),
+}
+COUNTERS = {
+    'db_connections_created_total': 'New database connections.',
+    'db_connections_reused_total': 'Requests served on an already open database connection.',
+    'db_connections_unusable_total': 'Open connections dropped by the health check.',
+}
+PROCESSES_KEY = 'metrics:processes'
+SNAPSHOT_KEY = 'metrics:{}'
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'serializer_time', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+class Registry:
+    """
+    Counters and histograms of this process: {route: {'requests': {(method, status): n}, histogram: [...]}},
+    a histogram is bucket counts followed by sum and count. Counters not tied to a route are kept
+    as {(name, label): n}.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.counters = {}
+        self.ident = f'{socket.gethostname()}:{os.getpid()}'
+        self.flushed = time.monotonic()
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+            self.counters = {}
+
+    def count(self, name, label):
+        with self.lock:
+            self.counters[name, label] = self.counters.get((name, label), 0) + 1
+
+    def observe(self, route, method, status, values):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {'requests': {}}
+                for name, (_, buckets) in HISTOGRAMS.items():
+                    stats[name] = [0] * (len(buckets) + 2)
+            key = (method, status)
+            stats['requests'][key] = stats['requests'].get(key, 0) + 1
+            for name, value in values.items():
+                histogram = stats[name]
+                buckets = HISTOGRAMS[name][1]
+                # cumulative counts are built on export, here each observation lands in one bucket
+                index = bisect_left(buckets, value)
+                if index < len(buckets):
+                    histogram[index] += 1
+                histogram[-2] += value
+                histogram[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            routes = {route: {name: dict(value) if name == 'requests' else list(value)
+                              for name, value in stats.items()}
+                      for route, stats in self.routes.items()}
+            return {'routes': routes, 'counters': dict(self.counters)}
+
+    def flush(self, force=False):
+        """
+        Store the snapshot of this process in the cache at most every METRICS_FLUSH_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed = now
+        cache = caches[settings.METRICS_CACHE_ALIAS]
+        timeout = settings.METRICS_FLUSH_INTERVAL * 10
+        cache.set(SNAPSHOT_KEY.format(self.ident), self.snapshot(), timeout)
+        processes = cache.get(PROCESSES_KEY) or {}
+        if self.ident not in processes:
+            processes[self.ident] = True
+            cache.set(PROCESSES_KEY, processes, None)
+
+
+registry = Registry()
+
+
+def collect():
+    """
+    Sum snapshots of all processes that flushed recently.
+    """
+    registry.flush(force=True)
+    cache = caches[settings.METRICS_CACHE_ALIAS]
+    processes = cache.get(PROCESSES_KEY) or {}
+    snapshots = cache.get_many([SNAPSHOT_KEY.format(ident) for ident in processes])
+    live = {ident: True for ident in processes if SNAPSHOT_KEY.format(ident) in snapshots}
+    if len(live) != len(processes):
+        # processes that stopped flushing have expired snapshots
+        cache.set(PROCESSES_KEY, live, None)
+    total, counters = {}, {}
+    for snapshot in snapshots.values():
+        for key, count in snapshot['counters'].items():
+            counters[key] = counters.get(key, 0) + count
+        for route, stats in snapshot['routes'].items():
+            merged = total.setdefault(route, {'requests': {}})
+            for key, count in stats['requests'].items():
+                merged['requests'][key] = merged['requests'].get(key, 0) + count
+            for name in HISTOGRAMS:
+                histogram = merged.setdefault(name, [0] * len(stats[name]))
+                merged[name] = [a + b for a, b in zip(histogram, stats[name])]
+    return total, counters
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(routes, counters):
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (counter, alias), count in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'{name}{{alias="{escape(alias)}"}} {count}')
+    lines += ['# HELP http_requests_total Requests by route, method and status.',
+             '# TYPE http_requests_total counter']
+    for route, stats in sorted(routes.items()):
+        for (method, status), count in sorted(stats['requests'].items()):
+            lines.append(f'http_requests_total{{route="{escape(route)}",method="{method}",status="{status}"}} '
+                         f'{count}')
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for route, stats in sorted(routes.items()):
+            histogram = stats[name]
+            label = f'route="{escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(buckets, histogram):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram[-1]}')
+            lines.append(f'{name}_sum{{{label}}} {histogram[-2]:.6f}')
+            lines.append(f'{name}_count{{{label}}} {histogram[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    registry.count('db_connections_created_total', connection.alias)
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        # flushing writes to the cache
+        await sync_to_async(self.record)(request, response, stats, started)
+        return response
+
+    def record(self, request, response, stats, started):
+        match = request.resolver_match
+        registry.observe(match.url_name or match.view_name if match else 'unmatched', request.method,
+                         response.status_code, {
+                             'http_request_duration_seconds': time.perf_counter() - started,
+                             'db_queries_per_request': stats.queries,
+                             'db_query_duration_seconds': stats.sql_time,
+                             'serializer_duration_seconds': stats.serializer_time,
+                         })
+        registry.flush()
+
+
+class TimedRepresentationMixin:
+    """
+    Add time of to_representation to the request metrics, nested serializers are counted once.
+    """
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            stats.serializer_time += time.perf_counter() - started
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, str) else str(data)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(render_prometheus(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,120 @@
+"""
+Sliding-window rate limits on top of the Django cache, locmem in development and Redis with several nodes.
+
+Each scope keeps one counter per fixed window. The request rate is estimated as the current window count
+plus the previous one weighted by the part of it still inside the sliding window, which needs two keys
+per client instead of DRF's list of request timestamps.
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        self.wait_time = None
+
+    def get_ident_key(self, request, view):
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        elapsed = self.now - window * self.duration
+        current_key, previous_key = f'{self.key}:{window}', f'{self.key}:{window - 1}'
+
+        # count the request before deciding, concurrent requests then see each other's increments
+        # counters live two windows, while they can still be the previous one
+        self.cache.add(current_key, 0, self.duration * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            self.cache.set(current_key, 1, self.duration * 2)
+            current = 1
+        previous = self.cache.get(previous_key, 0)
+
+        if previous * (1 - elapsed / self.duration) + current > self.num_requests:
+            # rejected requests do not use up the budget
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            self.wait_time = self.get_wait_time(current - 1, previous, elapsed)
+            return False
+        return True
+
+    def get_wait_time(self, current, previous, elapsed):
+        if current >= self.num_requests:
+            # blocked until the current window decays enough after it becomes the previous one
+            wait = self.duration - elapsed + self.duration * (1 - self.num_requests / current)
+        else:
+            wait = self.duration * (1 - (self.num_requests - current) / previous) - elapsed
+        return max(1, math.ceil(wait))
+
+    def wait(self):
+        return self.wait_time
+
+
+class AuthRateThrottle(SlidingWindowThrottle):
+    """
+    Per-IP budget of login, refresh and registration, checked before any password hashing.
+    """
+    scope = 'auth'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class LoginRateThrottle(SlidingWindowThrottle):
+    """
+    Per-username budget of login attempts, against guessing one account from many addresses.
+    """
+    scope = 'login'
+
+    def get_ident_key(self, request, view):
+        username = request.data.get('username') if isinstance(request.data, dict) else None
+        return username.lower() if isinstance(username, str) and username else None
+
+
+class UserRateThrottle(SlidingWindowThrottle):
+    """
+    Per-user budget, per-IP for anonymous requests.
+    """
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class WriteRateThrottle(UserRateThrottle):
+    scope = 'write'
+
+    def get_ident_key(self, request, view):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        return super().get_ident_key(request, view)
+
+
+class UploadRateThrottle(UserRateThrottle):
+    scope = 'upload'
+
+
+class GradingRateThrottle(UserRateThrottle):
+    scope = 'grading'
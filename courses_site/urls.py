@@ -19,6 +19,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from .metrics import MetricsView
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Swagger API",
@@ -33,6 +35,8 @@ urlpatterns = [
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('admin/', admin.site.urls),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('users/', include('users.urls')),
     path('course/', include('course.urls')),
+    path('async/course/', include('course.async_views')),
 ]
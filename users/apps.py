@@ -5,5 +5,5 @@ class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
 
-    # def ready(self):
-    #     import users.signal
+    def ready(self):
+        import users.signals  # noqa: F401
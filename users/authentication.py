@@ -0,0 +1,87 @@
+"""
+JWT authentication without a database query per request.
+
+The user is rebuilt from a small cached dict of its fields and the row is only read on a cache miss.
+Revoked tokens are kept in the cache by jti until they expire, so the check is a single key lookup.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.settings import api_settings
+
+USER_CACHE_KEY = 'auth-user:{}'
+REVOKED_CACHE_KEY = 'revoked-token:{}'
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def revoke_token(token):
+    """
+    Reject the token until it expires on its own.
+    """
+    leeway = api_settings.LEEWAY
+    if isinstance(leeway, timedelta):
+        leeway = leeway.total_seconds()
+    ttl = int(token['exp'] - time.time() + leeway) + 1
+    if ttl > 0:
+        cache.set(REVOKED_CACHE_KEY.format(token[api_settings.JTI_CLAIM]), True, ttl)
+
+
+def is_revoked(token):
+    return cache.get(REVOKED_CACHE_KEY.format(token.get(api_settings.JTI_CLAIM))) is not None
+
+
+def load_user(user_id):
+    """
+    Return the user built from cached fields. It has no password, so it must not be saved.
+    """
+    key = USER_CACHE_KEY.format(user_id)
+    fields = cache.get(key)
+    if fields is None:
+        fields = User.objects.using(DEFAULT_DB_ALIAS).filter(**{api_settings.USER_ID_FIELD: user_id})\
+            .values(*USER_FIELDS).first()
+        if fields is None:
+            return None
+        cache.set(key, fields, settings.AUTH_USER_CACHE_TIMEOUT)
+    user = User(**fields)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def invalidate_user(user_id):
+    """
+    Evict the cached user now and again after commit, a request running before the commit
+    would otherwise cache the old row (e.g. is_active) again.
+    """
+    key = USER_CACHE_KEY.format(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken({'detail': 'Token is revoked.', 'code': 'token_not_valid'})
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = load_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
@@ -0,0 +1,36 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from course.membership import STUDENT, TEACHER
+from course.models import Course
+from users.provisioning import import_users, iter_csv_users
+
+
+class Command(BaseCommand):
+    help = ('Create users from csv with header username,email,password,first_name,last_name, '
+            'optionally enrolling them into a course.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file.')
+        parser.add_argument('--course', type=int, help='Course id to enroll created users into.')
+        parser.add_argument('--role', choices=(STUDENT, TEACHER), default=STUDENT)
+        parser.add_argument('--no-email', action='store_true', help='Do not queue welcome emails.')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--workers', type=int, help='Password hashing processes.')
+
+    def handle(self, *args, **options):
+        course = None
+        if options['course']:
+            try:
+                course = Course.objects.get(pk=options['course'])
+            except Course.DoesNotExist:
+                raise CommandError(f'Course {options["course"]} does not exist.')
+
+        with open(options['path'], 'rb') as file:
+            report = import_users(iter_csv_users(file), course=course, role=options['role'],
+                                  send_welcome=not options['no_email'], batch_size=options['batch_size'],
+                                  workers=options['workers'] or settings.USER_IMPORT_WORKERS)
+        self.stdout.write(json.dumps(report.as_dict(), indent=2))
+        self.stdout.write(self.style.SUCCESS(f'{report.created} users created.'))
@@ -0,0 +1,105 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+RATE_CACHE_KEY = 'email-outbox-sent:{}'
+
+
+def enqueue_email(to, subject, body, from_email=''):
+    return OutboxEmail.objects.create(to=to, subject=subject, body=body, from_email=from_email)
+
+
+def enqueue_emails(recipients, subject, body, from_email=''):
+    """
+    Queue the same email to many recipients with batched inserts.
+    """
+    return OutboxEmail.objects.bulk_create(
+        (OutboxEmail(to=to, subject=subject, body=body, from_email=from_email) for to in recipients),
+        batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+    )
+
+
+def reserve_quota(limit):
+    """
+    Take up to `limit` sends from the per minute budget shared by all workers.
+    Returns the budget key and the number of reserved sends.
+    """
+    key = RATE_CACHE_KEY.format(int(timezone.now().timestamp() // 60))
+    cache.add(key, 0, timeout=120)
+    used = cache.incr(key, limit)
+    allowed = max(0, min(limit, settings.EMAIL_OUTBOX_RATE_PER_MINUTE - (used - limit)))
+    if allowed < limit:
+        cache.decr(key, limit - allowed)
+    return key, allowed
+
+
+def claim_emails(limit, now):
+    """
+    Take up to `limit` due emails by moving their next attempt past the claim timeout, in a short transaction.
+    """
+    with transaction.atomic():
+        emails = list(OutboxEmail.objects.select_for_update(skip_locked=True)
+                      .filter(status=OutboxEmail.PENDING, next_attempt__lte=now)
+                      .order_by('next_attempt')[:limit])
+        if emails:
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in emails])\
+                .update(next_attempt=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT))
+    return emails
+
+
+def drain_outbox():
+    """
+    Send one batch of due emails over a single SMTP connection.
+    Emails are claimed before and recorded after sending, no transaction is open while SMTP is slow.
+    Failed emails are retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS.
+    """
+    quota_key, limit = reserve_quota(settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if not limit:
+        return 0
+    now = timezone.now()
+    emails = claim_emails(limit, now)
+    if len(emails) < limit:
+        cache.decr(quota_key, limit - len(emails))
+    if not emails:
+        return 0
+
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            fail(email, e, now)
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(email.subject, email.body, email.from_email or None, [email.to],
+                                       connection=connection)
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    fail(email, e, now)
+                else:
+                    email.status = OutboxEmail.SENT
+                    email.attempts += 1
+                    sent += 1
+        finally:
+            connection.close()
+    with transaction.atomic():
+        OutboxEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt', 'last_error'])
+    return sent
+
+
+def fail(email, error, now):
+    email.attempts += 1
+    email.last_error = repr(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+    else:
+        email.next_attempt = now + timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
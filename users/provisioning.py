@@ -0,0 +1,195 @@
+"""
+Bulk user creation from csv: uniqueness is checked per batch, passwords are hashed in a process pool
+and users are inserted with bulk_create, instead of the query, insert and update per user of registration.
+"""
+import csv
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+
+from course.membership import STUDENT
+from course.roster import enroll_users, iter_batches
+
+from .models import UserImport
+from .outbox import enqueue_emails
+
+COLUMNS = ('username', 'email', 'password', 'first_name', 'last_name')
+# problems are counted all, but only the first ones are listed in the report
+MAX_REPORTED = 100
+
+WELCOME_SUBJECT = 'Registration'
+WELCOME_BODY = 'You successfully registered on courses site app.'
+
+
+def iter_csv_users(file):
+    """
+    Yield (line number, row dict) from uploaded csv with a header line, line by line.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig'))
+    for row in reader:
+        row = {column: (row.get(column) or '').strip() for column in COLUMNS}
+        if any(row.values()):
+            yield reader.line_num, row
+
+
+def validate_row(row):
+    errors = []
+    try:
+        UnicodeUsernameValidator()(row['username'])
+    except ValidationError as e:
+        errors.extend(e.messages)
+    if row['email']:
+        try:
+            validate_email(row['email'])
+        except ValidationError as e:
+            errors.extend(e.messages)
+    if row['password']:
+        try:
+            validate_password(row['password'], User(username=row['username'], email=row['email']))
+        except ValidationError as e:
+            errors.extend(e.messages)
+    return errors
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.duplicates = []
+        self.duplicate_count = 0
+        self.invalid = []
+        self.invalid_count = 0
+        self.enrolled = 0
+
+    def add_duplicate(self, line, username):
+        self.duplicate_count += 1
+        if len(self.duplicates) < MAX_REPORTED:
+            self.duplicates.append({'line': line, 'username': username})
+
+    def add_invalid(self, line, errors):
+        self.invalid_count += 1
+        if len(self.invalid) < MAX_REPORTED:
+            self.invalid.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'duplicate_count': self.duplicate_count,
+            'invalid': self.invalid,
+            'invalid_count': self.invalid_count,
+            'enrolled': self.enrolled,
+        }
+
+
+def hash_passwords(passwords, executor):
+    # blank password makes the account unusable until it is reset
+    if executor is None:
+        return [make_password(password or None) for password in passwords]
+    return list(executor.map(make_password, [password or None for password in passwords], chunksize=16))
+
+
+def inserted_users(users):
+    """
+    Return the users which bulk_create(ignore_conflicts=True) actually inserted, with their ids set.
+    Password hashes are salted, so a row created concurrently under the same username has a different one.
+    """
+    stored = {username: (user_id, password) for user_id, username, password in User.objects.filter(
+        username__in=[user.username for user in users]).values_list('id', 'username', 'password')}
+    inserted = []
+    for user in users:
+        user_id, password = stored.get(user.username, (None, None))
+        if password == user.password:
+            user.pk = user_id
+            inserted.append(user)
+    return inserted
+
+
+def import_users(rows, course=None, role=STUDENT, send_welcome=True, batch_size=None, workers=1):
+    """
+    Create users from (line, row) pairs, skipping invalid rows and usernames/emails that are taken.
+    Optionally enroll created users into the course and queue a welcome email to them.
+    More than one worker hashes passwords in a process pool, meant for the management command only.
+    """
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+    report = ImportReport()
+    executor = ProcessPoolExecutor(workers, initializer=django.setup) if workers > 1 else None
+    try:
+        for batch in iter_batches(rows, batch_size):
+            report.processed += len(batch)
+            valid = []
+            for line, row in batch:
+                errors = validate_row(row)
+                if errors:
+                    report.add_invalid(line, errors)
+                else:
+                    valid.append((line, row))
+
+            usernames = {row['username'] for _, row in valid}
+            emails = {row['email'] for _, row in valid if row['email']}
+            taken_usernames, taken_emails = set(), set()
+            for username, email in User.objects.filter(Q(username__in=usernames) | Q(email__in=emails))\
+                    .values_list('username', 'email'):
+                taken_usernames.add(username)
+                if email:
+                    taken_emails.add(email)
+
+            new = []
+            for line, row in valid:
+                if row['username'] in taken_usernames or row['email'] in taken_emails:
+                    report.add_duplicate(line, row['username'])
+                    continue
+                taken_usernames.add(row['username'])
+                if row['email']:
+                    taken_emails.add(row['email'])
+                new.append(row)
+
+            passwords = hash_passwords([row['password'] for row in new], executor)
+            users = [User(username=row['username'], email=row['email'], first_name=row['first_name'],
+                          last_name=row['last_name'], password=password)
+                     for row, password in zip(new, passwords)]
+            with transaction.atomic():
+                User.objects.bulk_create(users, ignore_conflicts=True)
+                users = inserted_users(users)
+                if course is not None:
+                    report.enrolled += enroll_users(course, {user.pk: user.username for user in users}, role).affected
+                if send_welcome:
+                    enqueue_emails([user.email for user in users if user.email], WELCOME_SUBJECT, WELCOME_BODY)
+            report.created += len(users)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return report
+
+
+def start_import(file, course=None, role=STUDENT, send_welcome=True):
+    """
+    Keep uploaded csv in the database and import it in a celery task. Return the import.
+    """
+    from .task import import_users_file
+
+    user_import = UserImport.objects.create(content=file.read())
+    transaction.on_commit(lambda: import_users_file.delay(
+        str(user_import.pk), course.pk if course else None, role, send_welcome))
+    return user_import
+
+
+def import_result(user_import):
+    result = {'id': str(user_import.pk), 'status': user_import.status}
+    if user_import.status == UserImport.DONE:
+        result['report'] = user_import.report
+    elif user_import.status == UserImport.FAILED:
+        result['error'] = user_import.error
+    return result
@@ -2,9 +2,18 @@ from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from course.membership import STUDENT
+from course.models import Course, CourseMembership
+from courses_site.metrics import TimedRepresentationMixin
 
-class RegisterSerializer(serializers.ModelSerializer):
+from .authentication import is_revoked
+
+
+class RegisterSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     email = serializers.EmailField(
         required=True,
         validators=[UniqueValidator(queryset=User.objects.all())]
@@ -33,7 +42,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
-class ChangePasswordSerializer(serializers.ModelSerializer):
+class ChangePasswordSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
     old_password = serializers.CharField(write_only=True, required=True)
@@ -48,8 +57,8 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         return attrs
 
     def validate_old_password(self, value):
-        user = self.context['request'].user
-        if not user.check_password(value):
+        # request.user is built from cache without the password hash, the instance is the owner's row
+        if not self.instance.check_password(value):
             raise serializers.ValidationError({"old_password": "Old password is incorrect."})
 
     def update(self, instance, validated_data):
@@ -58,7 +67,7 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         return instance
 
 
-class UpdateUserSerializer(serializers.ModelSerializer):
+class UpdateUserSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('username', 'first_name', 'last_name', 'email')
@@ -83,3 +92,20 @@ class UpdateUserSerializer(serializers.ModelSerializer):
         instance.email = validated_data.get('email', user.email)
         instance.save()
         return instance
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that rejects refresh tokens revoked by logout.
+    """
+    def validate(self, attrs):
+        if is_revoked(RefreshToken(attrs['refresh'])):
+            raise InvalidToken('Token is revoked.')
+        return super().validate(attrs)
+
+
+class ImportUsersSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all(), required=False)
+    role = serializers.ChoiceField(choices=CourseMembership.ROLE_CHOICES, default=STUDENT)
+    send_welcome = serializers.BooleanField(default=True)
@@ -1,15 +1,31 @@
-from time import sleep
+import io
 
 from celery import shared_task
-from django.core.mail import send_mail
+
+from course.models import Course
+
+from .models import UserImport
+from .outbox import drain_outbox
+from .provisioning import import_users, iter_csv_users
+
+
+@shared_task()
+def drain_email_outbox():
+    return drain_outbox()
 
 
 @shared_task()
-def send_email(email):
-    sleep(5)
-    send_mail(
-        'Registration',
-        'You successfully registered on courses site app.',
-        'lkjhgfdsa@fastmail.com',
-        [email]
-    )
+def import_users_file(import_id, course_id, role, send_welcome):
+    """
+    Import users from csv kept by provisioning.start_import, the report is stored with the import.
+    """
+    user_import = UserImport.objects.get(pk=import_id)
+    course = Course.objects.filter(pk=course_id).first() if course_id else None
+    try:
+        report = import_users(iter_csv_users(io.BytesIO(bytes(user_import.content))), course=course, role=role,
+                              send_welcome=send_welcome)
+    except Exception as e:
+        UserImport.objects.filter(pk=import_id).update(status=UserImport.FAILED, error=repr(e), content=b'')
+        raise
+    UserImport.objects.filter(pk=import_id).update(status=UserImport.DONE, report=report.as_dict(), content=b'')
+    return report.as_dict()
@@ -1,15 +1,16 @@
 from django.urls import path
-from rest_framework_simplejwt.views import (TokenObtainPairView,
-                                            TokenRefreshView)
 
-from .views import (ChangePasswordView, LogoutView, RegisterView,
+from .views import (ChangePasswordView, ImportUsersStatusView, ImportUsersView,
+                    LoginView, LogoutView, RefreshView, RegisterView,
                     UpdateProfileView)
 
 urlpatterns = [
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('login/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('login/', LoginView.as_view(), name='token_obtain_pair'),
+    path('login/refresh/', RefreshView.as_view(), name='token_refresh'),
     path('register/', RegisterView.as_view(), name='register'),
     path('change_password/<int:pk>/', ChangePasswordView.as_view(), name='change_password'),
     path('update_profile/<int:pk>/', UpdateProfileView.as_view(), name='update_profile'),
-    path('logout/', LogoutView.as_view(), name='logout')
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('import/', ImportUsersView.as_view(), name='import-users'),
+    path('import/<uuid:import_id>/', ImportUsersStatusView.as_view(), name='import-users-status'),
 ]
@@ -1,19 +1,32 @@
 from django.contrib.auth.models import User
+from django.urls import reverse
 from rest_framework import generics, status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import (TokenObtainPairView,
+                                            TokenRefreshView)
 
+from courses_site.throttling import AuthRateThrottle, LoginRateThrottle
+
+from .authentication import revoke_token
+from .models import UserImport
+from .outbox import enqueue_email
 from .permissions import IsOwner
-from .serializers import (ChangePasswordSerializer, RegisterSerializer,
+from .provisioning import (WELCOME_BODY, WELCOME_SUBJECT, import_result,
+                           start_import)
+from .serializers import (ChangePasswordSerializer, ImportUsersSerializer,
+                          RegisterSerializer, RevocableTokenRefreshSerializer,
                           UpdateUserSerializer)
-from .task import send_email
 
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
     serializer_class = RegisterSerializer
 
     def post(self, request, *args, **kwargs):
@@ -23,7 +36,7 @@ class RegisterView(generics.CreateAPIView):
             print(e)
             return Response(status=status.HTTP_400_BAD_REQUEST)
         else:
-            send_email.delay(response.data.get('email'))
+            enqueue_email(response.data.get('email'), WELCOME_SUBJECT, WELCOME_BODY)
             return response
 
 
@@ -39,14 +52,62 @@ class UpdateProfileView(generics.UpdateAPIView):
     serializer_class = UpdateUserSerializer
 
 
+class LoginView(TokenObtainPairView):
+    throttle_classes = [AuthRateThrottle, LoginRateThrottle]
+
+
+class RefreshView(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
+    throttle_classes = [AuthRateThrottle]
+
+
 class LogoutView(APIView):
+    """
+    Revoke the refresh token and the access token of the request until they expire.
+    """
     permission_classes = [IsAuthenticated, IsOwner]
 
     def post(self, request):
         try:
             refresh_token = request.data["refresh_token"]
             token = RefreshToken(refresh_token)
-            token.blacklist()
+            if token.get(api_settings.USER_ID_CLAIM) != request.user.id:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            revoke_token(token)
+            revoke_token(request.auth)
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception:
             return Response(status=status.HTTP_400_BAD_REQUEST)
+
+
+class ImportUsersView(generics.GenericAPIView):
+    """
+    Create users from csv file with header: username,email,password,first_name,last_name.
+    The file is imported in background, its report is available at the returned `url`.
+    """
+    serializer_class = ImportUsersSerializer
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        user_import = start_import(data['file'], course=data.get('course'), role=data['role'],
+                                   send_welcome=data['send_welcome'])
+        url = request.build_absolute_uri(reverse('import-users-status', kwargs={'import_id': user_import.pk}))
+        return Response({**import_result(user_import), 'url': url}, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': url})
+
+
+class ImportUsersStatusView(APIView):
+    """
+    Status of the user import, with its report once it is done.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, import_id):
+        user_import = UserImport.objects.defer('content').filter(pk=import_id).first()
+        if user_import is None:
+            return Response({"detail": "Import not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(import_result(user_import))